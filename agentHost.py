@@ -0,0 +1,244 @@
+"""
+Runs capture agents in processes of their own.
+
+An AgentHost stands in for an agent in the game while the agent itself runs
+in a subprocess, so an agent that crashes, leaks memory or corrupts its
+interpreter can't take the game (or the games after it) down with it.
+
+Each turn the observation is encoded with stateCodec straight into the
+next slot of a small ring buffer in shared memory, and only the slot number
+goes down the pipe; the agent answers with its action code.  Every slot is
+stamped with the number of its request, so an agent that has fallen a whole
+ring behind (after moves that timed out) skips the requests whose slots
+have been written over since, instead of answering them from the wrong
+state.  The noisy sonar readings are drawn here, in the game process, and
+sent with the observation.  registerInitialState is the only call that
+pickles a whole GameState, once per game.
+
+Example:
+  agents = [AgentHost(agent) for agent in agents]
+  ... play games with agents ...
+  for agent in agents:
+      agent.close()
+"""
+
+import atexit
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+import struct
+import traceback
+
+import stateCodec
+
+RING_SLOTS = 4
+
+# request sequence number, encoded state size, number of sonar distances
+_SLOT_HEAD = struct.Struct('<IIB')
+
+# Hosts still running, closed when the game process exits
+_hosts = []
+
+
+class AgentHostException(Exception):
+    """Raised in the game process when a hosted agent fails"""
+    pass
+
+
+class AgentHost:
+    """
+    A proxy for an agent running in its own process.  Game can use it like
+    any other agent; a failure in the agent is raised here as an
+    AgentHostException, so Game's catchExceptions mode treats it as a crash.
+    """
+
+    def __init__(self, agent, startMethod=None):
+        self.index = agent.index
+        if startMethod is None and 'fork' in mp.get_all_start_methods():
+            # Agents loaded from team files can't always be pickled
+            startMethod = 'fork'
+        context = mp.get_context(startMethod)
+        # The agent's process must share our resource tracker, or its own
+        # tracker would unlink the shared memory when the process exits
+        resource_tracker.ensure_running()
+        self.observes = 'observationFunction' in dir(agent)
+        self.conn, childConn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(agent, childConn),
+                                       daemon=True)
+        self.process.start()
+        childConn.close()
+        self.memory = None
+        self.slotSize = 0
+        self.sequence = 0
+        _hosts.append(self)
+
+    def registerInitialState(self, gameState):
+        layout = gameState.data.layout
+        numAgents = gameState.getNumAgents()
+        slotSize = _SLOT_HEAD.size + stateCodec.maxSize(layout, numAgents) + 2 * numAgents
+        if self.memory is None or self.slotSize < slotSize:
+            self._releaseMemory()
+            self.memory = shared_memory.SharedMemory(create=True, size=slotSize * RING_SLOTS)
+            self.slotSize = slotSize
+        self._call('register', gameState, self.memory.name, self.slotSize)
+
+    def observationFunction(self, gameState):
+        # Hosted capture agents see what CaptureAgent.observationFunction
+        # would show them; agents without one see the whole state
+        if self.observes:
+            return gameState.makeObservation(self.index)
+        return gameState
+    # The state is only encoded for the agent's process (see game.Game.run)
+    observationFunction.copiesState = True
+
+    def getAction(self, observation):
+        code = self._call('act', self._write(observation))
+        return stateCodec.ACTIONS[code]
+
+    def final(self, gameState):
+        self._call('final', self._write(gameState))
+
+    def _write(self, state):
+        """
+        Encodes state into the next slot of the ring, for the next request,
+        and returns the slot.
+        """
+        sequence = self.sequence + 1
+        slot = sequence % RING_SLOTS
+        distances = state.getAgentDistances()
+        offset = slot * self.slotSize
+        buf = self.memory.buf
+        # The slot holds no request while it is written (see _read)
+        _SLOT_HEAD.pack_into(buf, offset, 0, 0, 0)
+        size = stateCodec.encodeInto(state, buf, offset + _SLOT_HEAD.size)
+        struct.pack_into('<%dh' % len(distances), buf, offset + _SLOT_HEAD.size + size,
+                         *distances)
+        _SLOT_HEAD.pack_into(buf, offset, sequence, size, len(distances))
+        return slot
+
+    def _call(self, kind, *args):
+        """
+        Sends a request to the agent's process and waits for its answer.
+        Answers to earlier requests (from moves that timed out) are skipped.
+        """
+        self.sequence += 1
+        try:
+            self.conn.send((kind, self.sequence) + args)
+            while True:
+                sequence, ok, result = self.conn.recv()
+                if sequence == self.sequence:
+                    break
+        except (EOFError, OSError) as e:
+            raise AgentHostException('Agent %d has died (%s)' % (self.index, e))
+        if not ok:
+            raise AgentHostException('Agent %d failed:\n%s' % (self.index, result))
+        return result
+
+    def _releaseMemory(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def close(self):
+        """
+        Stops the agent's process and frees the shared memory.
+        """
+        if self.process is None:
+            return
+        try:
+            self.conn.send(('close', 0))
+        except (EOFError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+        self._releaseMemory()
+        _hosts.remove(self)
+
+
+def closeAll():
+    """
+    Closes every AgentHost that is still running.
+    """
+    for host in list(_hosts):
+        host.close()
+
+atexit.register(closeAll)
+
+
+def _read(memory, slotSize, slot, layout, sequence):
+    """
+    Decodes the state of request sequence from slot, or returns None if the
+    slot has been (or is being) written over by a later request.
+    """
+    from capture import Sonar
+    offset = slot * slotSize
+    buf = memory.buf
+    written, size, numDistances = _SLOT_HEAD.unpack_from(buf, offset)
+    if written != sequence:
+        return None
+    try:
+        state = stateCodec.decode(buf, layout, offset + _SLOT_HEAD.size)
+        distances = struct.unpack_from('<%dh' % numDistances, buf,
+                                       offset + _SLOT_HEAD.size + size)
+    except Exception:
+        # Half written over
+        if _SLOT_HEAD.unpack_from(buf, offset)[0] != sequence:
+            return None
+        raise
+    if _SLOT_HEAD.unpack_from(buf, offset)[0] != sequence:
+        return None
+    if numDistances:
+        state._sonar = Sonar(None)
+        state._sonar.distances = list(distances)
+    return state
+
+
+def _serve(agent, conn):
+    """
+    The loop run in an agent's process: answers requests from its AgentHost
+    until told to close or the game process goes away.
+    """
+    memory = None
+    slotSize = 0
+    layout = None
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        kind, sequence = message[0], message[1]
+        if kind == 'close':
+            break
+        try:
+            result = None
+            if kind == 'register':
+                state, name, slotSize = message[2:]
+                if memory is None or memory.name != name:
+                    if memory is not None:
+                        memory.close()
+                    memory = shared_memory.SharedMemory(name=name)
+                layout = state.data.layout
+                if 'registerInitialState' in dir(agent):
+                    agent.registerInitialState(state)
+            elif kind in ('act', 'final'):
+                state = _read(memory, slotSize, message[2], layout, sequence)
+                if state is None:
+                    # A later request has taken the slot, so the game has
+                    # given up waiting for this one
+                    continue
+                if kind == 'act':
+                    result = stateCodec.ACTION_CODES[agent.getAction(state)]
+                elif 'final' in dir(agent):
+                    agent.final(state)
+        except Exception:
+            conn.send((sequence, False, traceback.format_exc()))
+            continue
+        conn.send((sequence, True, result))
+    if memory is not None:
+        memory.close()
+    conn.close()
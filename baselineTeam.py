@@ -30,6 +30,7 @@ import sys
 from game import Directions
 import game
 from util import nearestPoint
+from collections import OrderedDict
 
 #################
 # Team creation #
@@ -54,6 +55,76 @@ def createTeam(firstIndex, secondIndex, isRed,
     """
     return [eval(first)(firstIndex), eval(second)(secondIndex)]
 
+###################
+# Decision caches #
+###################
+
+
+class DecisionCache:
+    """
+    Remembers the decisions of reflex agents: the actions they choose from,
+    keyed by ReflexCaptureAgent.getDecisionKey.  Holds at most size
+    decisions, forgetting the least recently used first, and counts its
+    hits and misses.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.decisions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        decision = self.decisions.get(key)
+        if decision is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.decisions.move_to_end(key)
+        return decision
+
+    def put(self, key, decision):
+        self.decisions[key] = decision
+        if len(self.decisions) > self.size:
+            self.decisions.popitem(last=False)
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        return '%d hits of %d lookups (%.1f%%), %d of %d decisions held' % (
+            self.hits, self.hits + self.misses, 100.0 * self.hitRate(),
+            len(self.decisions), self.size)
+
+
+# The decision cache of each agent class, layout and agent index, shared by
+# the agents of every game in this process
+_decisionCaches = {}
+
+
+def getDecisionCache(agent, gameState, size):
+    """
+    Returns the decision cache agent shares with the agents of its class
+    that play with its index on the layout of gameState.
+    """
+    topology = gameState.data.layout.topology
+    key = (type(agent), id(topology), agent.index)
+    entry = _decisionCaches.get(key)
+    if entry is None or entry[0] is not topology:
+        entry = (topology, DecisionCache(size))
+        _decisionCaches[key] = entry
+    return entry[1]
+
+
+def decisionCacheReport():
+    """
+    Describes each decision cache of this process, one per line.
+    """
+    return '\n'.join('%s %d on %dx%d: %s' % (agentClass.__name__, index, topology.width,
+                                              topology.height, cache)
+                      for (agentClass, _, index), (topology, cache) in _decisionCaches.items())
+
 ##########
 # Agents #
 ##########
@@ -62,16 +133,62 @@ def createTeam(firstIndex, secondIndex, isRed,
 class ReflexCaptureAgent(CaptureAgent):
     """
     A base class for reflex agents that chooses score-maximizing actions
+
+    With a decisionCacheSize, the agent remembers the actions it chose
+    between in the situations getDecisionKey tells apart, in a cache shared
+    with the agents of its class and index on the same layout (see
+    getDecisionCache).  Ties are still broken at random, so the agent plays
+    exactly as it would without the cache.
     """
 
+    def __init__(self, index, timeForComputing=.1, decisionCacheSize=0):
+        CaptureAgent.__init__(self, index, timeForComputing)
+        self.decisionCacheSize = decisionCacheSize
+        self.decisionCache = None
+        self.decisionHits = 0
+        self.decisionLookups = 0
+
     def registerInitialState(self, gameState):
         self.start = gameState.getAgentPosition(self.index)
         CaptureAgent.registerInitialState(self, gameState)
+        if self.decisionCacheSize:
+            self.decisionCache = getDecisionCache(self, gameState, self.decisionCacheSize)
+
+    def getDecisionKey(self, gameState):
+        """
+        Returns a hashable key holding everything the decision in gameState
+        depends on, so that states with the same key get the same decision;
+        or None when the decision shouldn't be cached.  Agents that use a
+        decision cache must override this.
+        """
+        return None
 
     def chooseAction(self, gameState):
         """
         Picks among the actions with the highest Q(s,a).
         """
+        decision = None
+        key = None
+        if self.decisionCache is not None:
+            key = self.getDecisionKey(gameState)
+            if key is not None:
+                self.decisionLookups += 1
+                decision = self.decisionCache.get(key)
+                if decision is not None:
+                    self.decisionHits += 1
+        if decision is None:
+            decision = self.decide(gameState)
+            if key is not None:
+                self.decisionCache.put(key, decision)
+        if isinstance(decision, tuple):
+            return random.choice(decision)
+        return decision
+
+    def decide(self, gameState):
+        """
+        Returns the action to take in gameState, or a tuple of the best
+        actions when chooseAction should pick one of them at random.
+        """
         actions = gameState.getLegalActions(self.index)
 
         # You can profile your evaluation time by uncommenting these lines
@@ -80,22 +197,18 @@ class ReflexCaptureAgent(CaptureAgent):
         # print 'eval time for agent %d: %.4f' % (self.index, time.time() - start)
 
         maxValue = max(values)
-        bestActions = [a for a, v in zip(actions, values) if v == maxValue]
+        bestActions = tuple(a for a, v in zip(actions, values) if v == maxValue)
 
         foodLeft = len(self.getFood(gameState).asList())
 
         if foodLeft <= 2:
-            bestDist = 9999
-            for action in actions:
-                successor = self.getSuccessor(gameState, action)
-                pos2 = successor.getAgentPosition(self.index)
-                dist = self.getMazeDistance(self.start, pos2)
-                if dist < bestDist:
-                    bestAction = action
-                    bestDist = dist
-            return bestAction
-
-        return random.choice(bestActions)
+            # Head home: the first action that gets closest to the start
+            positions = [gameState.previewSuccessor(self.index, action).position
+                         for action in actions]
+            distances = self.distancer.getDistances(self.start, positions)
+            return actions[int(distances.argmin())]
+
+        return bestActions
 
     def getSuccessor(self, gameState, action):
         """
@@ -122,8 +235,9 @@ class ReflexCaptureAgent(CaptureAgent):
         Returns a counter of features for the state
         """
         features = util.Counter()
-        successor = self.getSuccessor(gameState, action)
-        features['successorScore'] = self.getScore(successor)
+        preview = gameState.previewSuccessor(self.index, action)
+        score = gameState.getScore() + preview.scoreChange
+        features['successorScore'] = score if self.red else -score
         return features
 
     def getWeights(self, gameState, action):
@@ -143,17 +257,23 @@ class OffensiveReflexAgent(ReflexCaptureAgent):
 
     def getFeatures(self, gameState, action):
         features = util.Counter()
-        successor = self.getSuccessor(gameState, action)
-        foodList = self.getFood(successor).asList()
-        features['successorScore'] = -len(foodList)  # self.getScore(successor)
+        preview = gameState.previewSuccessor(self.index, action)
+        food = self.getFood(gameState)
+        # The food this move eats or drops on the side we eat from
+        eaten = preview.foodEaten if preview.foodEaten is not None and food[preview.foodEaten[0]][preview.foodEaten[1]] else None
+        added = [pos for pos in preview.foodAdded if gameState.isRed(pos) != self.red]
+        numFood = food.count() - (eaten is not None) + len(added)
+        features['successorScore'] = -numFood  # self.getScore(successor)
 
         # Compute distance to the nearest food
 
-        if len(foodList) > 0:  # This should always be True,  but better safe than sorry
-            myPos = successor.getAgentState(self.index).getPosition()
-            minDistance = min([self.getMazeDistance(myPos, food)
-                               for food in foodList])
-            features['distanceToFood'] = minDistance
+        if numFood > 0:  # This should always be True,  but better safe than sorry
+            myPos = preview.position
+            if eaten is None and not added:
+                features['distanceToFood'] = self.getFoodField(gameState).getDistance(myPos)
+            else:
+                foodList = [pos for pos in food.asList() if pos != eaten] + added
+                features['distanceToFood'] = self.distancer.nearest(myPos, foodList)
         return features
 
     def getWeights(self, gameState, action):
@@ -170,26 +290,24 @@ class DefensiveReflexAgent(ReflexCaptureAgent):
 
     def getFeatures(self, gameState, action):
         features = util.Counter()
-        successor = self.getSuccessor(gameState, action)
-
-        myState = successor.getAgentState(self.index)
-        myPos = myState.getPosition()
+        preview = gameState.previewSuccessor(self.index, action)
+        myPos = preview.position
 
         # Computes whether we're on defense (1) or offense (0)
         features['onDefense'] = 1
-        if myState.isPacman:
+        if preview.isPacman:
             features['onDefense'] = 0
 
-        # Computes distance to invaders we can see
-        enemies = [successor.getAgentState(i)
-                   for i in self.getOpponents(successor)]
+        # Computes distance to invaders we can see (the ones this move
+        # catches are sent home)
+        enemies = [gameState.getAgentState(i) for i in self.getOpponents(gameState)
+                   if i not in preview.killed]
         invaders = [a for a in enemies if a.isPacman and a.getPosition()
                     != None]
         features['numInvaders'] = len(invaders)
         if len(invaders) > 0:
-            dists = [self.getMazeDistance(
-                myPos, a.getPosition()) for a in invaders]
-            features['invaderDistance'] = min(dists)
+            features['invaderDistance'] = self.distancer.nearest(
+                myPos, [a.getPosition() for a in invaders])
 
         if action == Directions.STOP:
             features['stop'] = 1
@@ -200,5 +318,29 @@ class DefensiveReflexAgent(ReflexCaptureAgent):
 
         return features
 
+    def getDecisionKey(self, gameState):
+        """
+        The decision depends on this agent's position (which fixes its legal
+        actions) and direction, whether it is scared, whether the food left
+        to eat is down to the last two, where the invaders it can see are,
+        and the enemy ghosts and capsules next to it (which decide whether
+        crossing the border kills it).
+        """
+        myState = gameState.getAgentState(self.index)
+        x, y = myState.getPosition()
+        enemies = []
+        for i in self.getOpponents(gameState):
+            enemyState = gameState.getAgentState(i)
+            pos = enemyState.getPosition()
+            if pos is None:
+                continue
+            if enemyState.isPacman:
+                enemies.append(pos)
+            elif abs(pos[0] - x) + abs(pos[1] - y) <= 1:
+                enemies.append((pos, enemyState.scaredTimer > 0))
+        capsules = tuple(c for c in gameState.data.capsules if abs(c[0] - x) + abs(c[1] - y) <= 1)
+        return ((x, y), myState.configuration.direction, myState.scaredTimer > 0,
+                self.getFood(gameState).count() <= 2, tuple(enemies), capsules)
+
     def getWeights(self, gameState, action):
         return {'numInvaders': -1000, 'onDefense': 100, 'invaderDistance': -10, 'stop': -100, 'reverse': -2}
@@ -64,28 +64,48 @@ import util
 import types
 import time
 import random
+import bisect
 import imp
 import keyboardAgents
+from captureRules import AgentRules
+from captureRules import KILL_POINTS, FOOD_POINTS, CAPSULE_POINTS, MIN_FOOD
+from captureRules import DUMP_FOOD_ON_DEATH, SCARED_TIME, COLLISION_TOLERANCE
 import geneticOptimizer
 
 # If you change these, you won't affect the server, so you can't cheat
-KILL_POINTS = .05
-FOOD_POINTS = .1
-CAPSULE_POINTS = .15
+# (the scoring rules themselves are in captureRules.pyx)
 SONAR_NOISE_RANGE = 13  # Must be odd
 SONAR_NOISE_VALUES = [i - (SONAR_NOISE_RANGE - 1) /
                       2 for i in range(SONAR_NOISE_RANGE)]
 SIGHT_RANGE = 5  # Manhattan distance
-MIN_FOOD = 2
-TOTAL_FOOD = 60
 
-DUMP_FOOD_ON_DEATH = True  # if we have the gameplay element that dumps dots on death
 
-SCARED_TIME = 40
+def noisyDistance(pos1, pos2):
+    return addSonarNoise(util.manhattanDistance(pos1, pos2))
 
 
-def noisyDistance(pos1, pos2):
-    return int(util.manhattanDistance(pos1, pos2) + random.choice(SONAR_NOISE_VALUES))
+def addSonarNoise(trueDistance):
+    return int(trueDistance + random.choice(SONAR_NOISE_VALUES))
+
+
+class Sonar:
+    """
+    The noisy distance readings of one observation.  The readings are only
+    drawn the first time they are asked for, and are shared by every state
+    copied or generated from that observation.  Only the true distances
+    are kept until then, never the positions, which the observation hides.
+    """
+
+    def __init__(self, trueDistances):
+        self.trueDistances = trueDistances
+        self.distances = None
+
+    def getDistances(self):
+        if self.distances is None:
+            self.distances = [addSonarNoise(distance)
+                              for distance in self.trueDistances]
+            self.trueDistances = None
+        return self.distances
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
@@ -104,6 +124,8 @@ class GameState:
     strongly suggest that you access that data via the accessor methods below rather
     than referring to the GameStateData object directly.
     """
+    __slots__ = ('data', 'teams', 'redTeam', 'blueTeam', '_redFood', '_blueFood',
+                 '_sonar', '_hiddenAgents', '_undoLog')
 
     ####################################################
     # Accessor methods: use these to access state data #
@@ -121,17 +143,85 @@ class GameState:
         """
         # Copy current state
         state = GameState(self)
+        state._applyRules(agentIndex, action)
+        return state
+
+    def previewSuccessor(self, agentIndex, action):
+        """
+        Returns a captureRules.SuccessorPreview of what action does to the
+        agent taking it (where it ends up, whether it is a Pacman, the food
+        it eats, carries and drops, ...) without making the successor state.
+        Much cheaper than generateSuccessor when that is all an agent needs.
+        """
+        return AgentRules.previewAction(self, action, agentIndex)
+
+    def snapshot(self):
+        """
+        Returns a token holding everything the rules can change in this
+        state; restore(token) puts the state back as it was.  Tokens are
+        cheap: food and capsules are shared, never copied.
+        """
+        data = self.data
+        return (tuple((a.configuration, a.isPacman, a.scaredTimer, a.numCarrying, a.numReturned)
+                      for a in data.agentStates),
+                data.food, data.capsules, self._redFood, self._blueFood,
+                data.score, data.scoreChange, data.timeleft, data._win, data._lose,
+                data._foodEaten, data._foodAdded, data._capsuleEaten, data._agentMoved)
+
+    def restore(self, token):
+        """
+        Restores a token returned by snapshot() on this state.
+        """
+        data = self.data
+        agents, data.food, data.capsules, self._redFood, self._blueFood, \
+            data.score, data.scoreChange, data.timeleft, data._win, data._lose, \
+            data._foodEaten, data._foodAdded, data._capsuleEaten, data._agentMoved = token
+        for agentState, fields in zip(data.agentStates, agents):
+            agentState.configuration, agentState.isPacman, agentState.scaredTimer, \
+                agentState.numCarrying, agentState.numReturned = fields
+        self._hiddenAgents = {}
+
+    def apply(self, agentIndex, action):
+        """
+        Like generateSuccessor, but changes this state in place instead of
+        allocating a new one.  Every apply can be reverted with undo(), so
+        search agents can walk a game tree on a single state:
 
+          state.apply(agentIndex, action)
+          value = search(state)
+          state.undo()
+        """
+        self._undoLog.append(self.snapshot())
+        data = self.data
+        data._foodEaten = None
+        data._foodAdded = None
+        data._capsuleEaten = None
+        data._lose = False
+        data._win = False
+        data.scoreChange = 0
+        self._hiddenAgents = {}
+        self._applyRules(agentIndex, action)
+
+    def undo(self):
+        """
+        Reverts the last apply() that has not been undone yet.
+        """
+        self.restore(self._undoLog.pop())
+
+    def _applyRules(self, agentIndex, action):
+        """
+        Applies the rules for agentIndex taking action to this state, which
+        must have its per-move flags and scoreChange cleared.
+        """
         # Find appropriate rules for the agent
-        AgentRules.applyAction(state, action, agentIndex)
-        AgentRules.checkDeath(state, agentIndex)
-        AgentRules.decrementTimer(state.data.agentStates[agentIndex])
+        AgentRules.applyAction(self, action, agentIndex)
+        AgentRules.checkDeath(self, agentIndex)
+        AgentRules.decrementTimer(self.data.agentStates[agentIndex])
 
         # Book keeping
-        state.data._agentMoved = agentIndex
-        state.data.score += state.data.scoreChange
-        state.data.timeleft = self.data.timeleft - 1
-        return state
+        self.data._agentMoved = agentIndex
+        self.data.score += self.data.scoreChange
+        self.data.timeleft = self.data.timeleft - 1
 
     def getAgentState(self, index):
         return self.data.agentStates[index]
@@ -161,16 +251,22 @@ class GameState:
         Returns a matrix of food that corresponds to the food on the red team's side.
         For the matrix m, m[x][y]=true if there is food in (x,y) that belongs to
         red (meaning red is protecting it, blue is trying to eat it).
+
+        The matrix is a read-only TeamFood view; call copy() for a Grid you
+        can modify.
         """
-        return halfGrid(self.data.food, red=True)
+        return self._redFood
 
     def getBlueFood(self):
         """
         Returns a matrix of food that corresponds to the food on the blue team's side.
         For the matrix m, m[x][y]=true if there is food in (x,y) that belongs to
         blue (meaning blue is protecting it, red is trying to eat it).
+
+        The matrix is a read-only TeamFood view; call copy() for a Grid you
+        can modify.
         """
-        return halfGrid(self.data.food, red=False)
+        return self._blueFood
 
     def getRedCapsules(self):
         return halfList(self.data.capsules, self.data.food, red=True)
@@ -204,13 +300,13 @@ class GameState:
         """
         Returns a list of agent index numbers for the agents on the red team.
         """
-        return self.redTeam[:]
+        return list(self.redTeam)
 
     def getBlueTeamIndices(self):
         """
         Returns a list of the agent index numbers for the agents on the blue team.
         """
-        return self.blueTeam[:]
+        return list(self.blueTeam)
 
     def isOnRedTeam(self, agentIndex):
         """
@@ -222,10 +318,11 @@ class GameState:
         """
         Returns a noisy distance to each agent.
         """
-        if 'agentDistances' in dir(self):
-            return self.agentDistances
-        else:
-            return None
+        if self._sonar is None:
+            return []
+        return self._sonar.getDistances()
+
+    agentDistances = property(getAgentDistances)
 
     def getDistanceProb(self, trueDistance, noisyDistance):
         "Returns the probability of a noisy distance given the true distance"
@@ -260,50 +357,71 @@ class GameState:
             self.data.timeleft = prevState.data.timeleft
 
             self.teams = prevState.teams
-            self.agentDistances = prevState.agentDistances
+            self._redFood = prevState._redFood
+            self._blueFood = prevState._blueFood
+            self._sonar = prevState._sonar
         else:
             self.data = GameStateData()
-            self.agentDistances = []
+            self._sonar = None
+        self._hiddenAgents = {}
+        self._undoLog = []
 
     def deepCopy(self):
         state = GameState(self)
         state.data = self.data.deepCopy()
         state.data.timeleft = self.data.timeleft
 
-        state.blueTeam = self.blueTeam[:]
-        state.redTeam = self.redTeam[:]
-        state.teams = self.teams[:]
-        state.agentDistances = self.agentDistances[:]
         return state
 
     def makeObservation(self, index):
-        state = self.deepCopy()
+        """
+        Returns the state as seen by the agent at index: a copy of this state
+        (sharing its food and layout) with unseen opponents removed.  The
+        noisy sonar readings are drawn when getAgentDistances is first called.
+        """
+        state = GameState(self)
+        state.data._agentMoved = self.data._agentMoved
+        state.data._foodEaten = self.data._foodEaten
+        state.data._foodAdded = self.data._foodAdded
+        state.data._capsuleEaten = self.data._capsuleEaten
 
         # Adds the sonar signal
-        pos = state.getAgentPosition(index)
-        n = state.getNumAgents()
-        distances = [noisyDistance(pos, state.getAgentPosition(i))
-                     for i in range(n)]
-        state.agentDistances = distances
+        pos = self.getAgentPosition(index)
+        state._sonar = Sonar([util.manhattanDistance(pos, self.getAgentPosition(i))
+                              for i in range(self.getNumAgents())])
 
         # Remove states of distant opponents
-        if index in self.blueTeam:
-            team = self.blueTeam
-            otherTeam = self.redTeam
-        else:
-            otherTeam = self.blueTeam
-            team = self.redTeam
-
-        for enemy in otherTeam:
-            seen = False
-            enemyPos = state.getAgentPosition(enemy)
-            for teammate in team:
-                if util.manhattanDistance(enemyPos, state.getAgentPosition(teammate)) <= SIGHT_RANGE:
-                    seen = True
-            if not seen:
-                state.data.agentStates[enemy].configuration = None
+        for enemy in self.getHiddenAgents(self.teams[index]):
+            state.data.agentStates[enemy].configuration = None
         return state
 
+    def getHiddenAgents(self, red):
+        """
+        Returns the opponents of the given team that are out of sight of every
+        member of that team.  Computed once per state and team.
+        """
+        hidden = self._hiddenAgents.get(red)
+        if hidden is None:
+            if red:
+                team, otherTeam = self.redTeam, self.blueTeam
+            else:
+                team, otherTeam = self.blueTeam, self.redTeam
+            teamPositions = [self.getAgentPosition(i) for i in team]
+            hidden = []
+            for enemy in otherTeam:
+                enemyPos = self.getAgentPosition(enemy)
+                if enemyPos is None:
+                    continue
+                seen = False
+                for teammatePos in teamPositions:
+                    if util.manhattanDistance(enemyPos, teammatePos) <= SIGHT_RANGE:
+                        seen = True
+                        break
+                if not seen:
+                    hidden.append(enemy)
+            self._hiddenAgents[red] = hidden
+        return hidden
+
     def __eq__(self, other):
         """
         Allows two states to be compared.
@@ -327,22 +445,44 @@ class GameState:
         Creates an initial game state from a layout array (see layout.py).
         """
         self.data.initialize(layout, numAgents)
-        positions = [a.configuration for a in self.data.agentStates]
-        self.blueTeam = [i for i, p in enumerate(
-            positions) if not self.isRed(p)]
-        self.redTeam = [i for i, p in enumerate(positions) if self.isRed(p)]
-        self.teams = [self.isRed(p) for p in positions]
-        # This is usually 60 (always 60 with random maps)
-        # However, if layout map is specified otherwise, it could be less
-        global TOTAL_FOOD
-        TOTAL_FOOD = layout.totalFood
+        # Team membership never changes, so it is worked out once here and
+        # shared by every state of the game: teams[i] is true for red agents
+        self.teams = tuple(self.isRed(a.configuration)
+                           for a in self.data.agentStates)
+        self.redTeam = tuple(i for i, red in enumerate(self.teams) if red)
+        self.blueTeam = tuple(i for i, red in enumerate(self.teams) if not red)
+        self._redFood = TeamFood.fromGrid(self.data.food, red=True)
+        self._blueFood = TeamFood.fromGrid(self.data.food, red=False)
+
+    def _eatFood(self, position):
+        """
+        Removes the food at position from the food grid and its team's half.
+        """
+        x, y = position
+        self.data.food = self.data.food.copyColumns([x])
+        self.data.food[x][y] = False
+        if x < self._redFood.halfway:
+            self._redFood = self._redFood.withoutFood((x, y))
+        else:
+            self._blueFood = self._blueFood.withoutFood((x, y))
+
+    def _addTeamFood(self, positions):
+        """
+        Records food already placed on the food grid at positions in the
+        team halves.
+        """
+        halfway = self._redFood.halfway
+        red = [p for p in positions if p[0] < halfway]
+        blue = [p for p in positions if p[0] >= halfway]
+        if red:
+            self._redFood = self._redFood.withFood(red)
+        if blue:
+            self._blueFood = self._blueFood.withFood(blue)
 
     def isRed(self, configOrPos):
-        width = self.data.layout.width
-        if type(configOrPos) == type((0, 0)):
-            return configOrPos[0] < width / 2
-        else:
-            return configOrPos.pos[0] < width / 2
+        if isinstance(configOrPos, tuple):
+            return self.data.layout.topology.isRedSide(configOrPos)
+        return self.data.layout.topology.isRedSide(configOrPos.pos)
 
 
 def halfGrid(grid, red):
@@ -361,6 +501,99 @@ def halfGrid(grid, red):
     return halfgrid
 
 
+class TeamFood:
+    """
+    A read-only view of the food on one team's half of the board.
+
+    It supports the parts of the Grid interface agents use (food[x][y],
+    count(), asList(), copy()) without copying the board.  Team food is never
+    changed in place: eating or dumping food makes a new TeamFood, so
+    successor states share it until food on that half changes.
+    """
+
+    def __init__(self, width, height, red, positions):
+        self.width = width
+        self.height = height
+        self.red = red
+        self.halfway = int(width / 2)
+        # Sorted, so in the same order as Grid.asList
+        self.positions = positions
+        self._columns = None
+
+    def fromGrid(grid, red):
+        halfway = int(grid.width / 2)
+        if red:
+            xrange = range(halfway)
+        else:
+            xrange = range(halfway, grid.width)
+        positions = tuple((x, y) for x in xrange for y in range(grid.height)
+                          if grid[x][y])
+        return TeamFood(grid.width, grid.height, red, positions)
+    fromGrid = staticmethod(fromGrid)
+
+    def withoutFood(self, position):
+        positions = self.positions
+        i = bisect.bisect_left(positions, position)
+        if i == len(positions) or positions[i] != position:
+            return self
+        return TeamFood(self.width, self.height, self.red,
+                        positions[:i] + positions[i + 1:])
+
+    def withFood(self, newPositions):
+        positions = sorted(set(self.positions).union(newPositions))
+        return TeamFood(self.width, self.height, self.red, tuple(positions))
+
+    def __getitem__(self, x):
+        if self._columns is None:
+            columns = [[False] * self.height for _ in range(self.width)]
+            for fx, fy in self.positions:
+                columns[fx][fy] = True
+            self._columns = tuple(tuple(column) for column in columns)
+        return self._columns[x]
+
+    def count(self, item=True):
+        if item:
+            return len(self.positions)
+        return self.width * self.height - len(self.positions)
+
+    def asList(self, key=True):
+        if key:
+            return list(self.positions)
+        return self.copy().asList(key)
+
+    def copy(self):
+        grid = Grid(self.width, self.height, False)
+        for x, y in self.positions:
+            grid[x][y] = True
+        return grid
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def packBits(self):
+        return self.copy().packBits()
+
+    def getData(self):
+        return [list(column) for column in self[0:self.width]]
+    data = property(getData)
+
+    def __eq__(self, other):
+        if other == None:
+            return False
+        if isinstance(other, TeamFood):
+            return self.positions == other.positions and self.width == other.width
+        return self.data == other.data
+
+    def __hash__(self):
+        return hash(self.copy())
+
+    def __str__(self):
+        return str(self.copy())
+
+
 def halfList(l, grid, red):
     halfway = grid.width / 2
     newList = []
@@ -378,7 +611,67 @@ def halfList(l, grid, red):
 ############################################################################
 
 
-COLLISION_TOLERANCE = 0.7  # How close ghosts must be to Pacman to kill
+class EarlyTermination:
+    """
+    An opt-in policy for ending a capture game before game.length moves once
+    playing on can't change (or is very unlikely to change) the outcome.
+    Give one to CaptureRules to use it.
+
+    decided:    end the game once the score's sign can no longer change.  The
+                bound is conservative: the trailing team is assumed to return
+                all the food it carries and all the food left on its
+                opponent's side (1 point each), and to score the most any
+                single move can otherwise score (FOOD_POINTS or CAPSULE_POINTS
+                plus two kills, under 0.25) on every remaining move.
+    stallMoves: end the game after this many moves in a row without a change
+                in the score, the food on the board or the food carried.
+                None turns the rule off.
+    stalledAgents: end the game as 'stalled' as soon as an agent that has an
+                isStalled() method (e.g. captureAgents.GenesAgent) reports
+                that it is stuck.
+    """
+
+    MAX_POINTS_PER_MOVE = 0.25
+
+    def __init__(self, decided=True, stallMoves=None, stalledAgents=False):
+        self.decided = decided
+        self.stallMoves = stallMoves
+        self.stalledAgents = stalledAgents
+
+    def check(self, state, game):
+        """
+        Returns why the game should end now ('decided' or 'stalled'), or None
+        to play on.
+        """
+        numMoves = len(game.moveHistory)
+        if self.stalledAgents and numMoves:
+            # Only the agent that just moved can have become stalled
+            agent = game.agents[game.moveHistory[-1][0]]
+            isStalled = getattr(agent, 'isStalled', None)
+            if isStalled is not None and isStalled():
+                return 'stalled'
+        if self.stallMoves is not None:
+            data = state.data
+            fingerprint = (data.score, state._redFood.count(), state._blueFood.count(),
+                           tuple(a.numCarrying for a in data.agentStates))
+            if fingerprint != game.lastProgress[0]:
+                game.lastProgress = (fingerprint, numMoves)
+            elif numMoves - game.lastProgress[1] >= self.stallMoves:
+                return 'stalled'
+        if self.decided:
+            score = state.data.score
+            if score == 0:
+                return None
+            if score > 0:
+                trailingTeam, foodLeft = state.blueTeam, state._redFood.count()
+            else:
+                trailingTeam, foodLeft = state.redTeam, state._blueFood.count()
+            carrying = sum(state.data.agentStates[i].numCarrying for i in trailingTeam)
+            remainingMoves = game.length - numMoves
+            swing = foodLeft + carrying + self.MAX_POINTS_PER_MOVE * remainingMoves
+            if abs(score) > swing:
+                return 'decided'
+        return None
 
 
 class CaptureRules:
@@ -387,10 +680,15 @@ class CaptureRules:
     and how the game starts and ends.
     """
 
-    def __init__(self, quiet=False):
+    def __init__(self, quiet=False, earlyTermination=None):
         self.quiet = quiet
+        self.earlyTermination = earlyTermination
 
-    def newGame(self, layout, agents, display, length, muteAgents, catchExceptions):
+    def newGame(self, layout, agents, display, length, muteAgents, catchExceptions, recorder=None):
+        """
+        Sets up a game.  If a recording.ReplayWriter is given as recorder, every
+        move is written to it as the game is played.
+        """
         initState = GameState()
         initState.initialize(layout, len(agents))
         starter = random.randint(0, 1)
@@ -400,6 +698,14 @@ class CaptureRules:
         game.state = initState
         game.length = length
         game.state.data.timeleft = length
+        game.recorder = recorder
+        # Why the game ended ('food', 'length', 'decided', 'stalled'), and how
+        # many of its moves were never played
+        game.endReason = None
+        game.movesSaved = 0
+        game.lastProgress = (None, 0)
+        if recorder is not None:
+            recorder.begin(initState)
         if 'drawCenterLine' in dir(display):
             display.drawCenterLine()
         self._initBlueFood = initState.getBlueFood().count()
@@ -410,19 +716,36 @@ class CaptureRules:
         """
         Checks to see whether it is time to end the game.
         """
+        if game.recorder is not None:
+            agentIndex, action = game.moveHistory[-1]
+            game.recorder.recordMove(agentIndex, action, state)
+
         if 'moveHistory' in dir(game):
             if len(game.moveHistory) == game.length:
                 state.data._win = True
+                game.endReason = 'length'
+
+        if not state.isOver() and self.earlyTermination is not None:
+            reason = self.earlyTermination.check(state, game)
+            if reason is not None:
+                state.data._win = True
+                game.endReason = reason
+                game.movesSaved = game.length - len(game.moveHistory)
+                if not self.quiet:
+                    print('Game ended early (%s), %d moves before the end.' %
+                          (reason, game.movesSaved))
 
         if state.isOver():
             game.gameOver = True
+            if game.endReason is None:
+                game.endReason = 'food'
             if not game.rules.quiet:
                 redCount = 0
                 blueCount = 0
-                foodToWin = (TOTAL_FOOD/2) - MIN_FOOD
+                foodToWin = (state.data.layout.totalFood/2) - MIN_FOOD
                 for index in range(state.getNumAgents()):
                     agentState = state.data.agentStates[index]
-                    if index in state.getRedTeamIndices():
+                    if state.teams[index]:
                         redCount += agentState.numReturned
                     else:
                         blueCount += agentState.numReturned
@@ -479,330 +802,6 @@ class CaptureRules:
         return 2  # Third violation loses the game
 
 
-class AgentRules:
-    """
-    These functions govern how each agent interacts with her environment.
-    """
-
-    def getLegalActions(state, agentIndex):
-        """
-        Returns a list of legal actions (which are both possible & allowed)
-        """
-        agentState = state.getAgentState(agentIndex)
-        conf = agentState.configuration
-        possibleActions = Actions.getPossibleActions(
-            conf, state.data.layout.walls)
-        return AgentRules.filterForAllowedActions(agentState, possibleActions)
-    getLegalActions = staticmethod(getLegalActions)
-
-    def filterForAllowedActions(agentState, possibleActions):
-        return possibleActions
-    filterForAllowedActions = staticmethod(filterForAllowedActions)
-
-    def applyAction(state, action, agentIndex):
-        """
-        Edits the state to reflect the results of the action.
-        """
-        legal = AgentRules.getLegalActions(state, agentIndex)
-        if action not in legal:
-            raise Exception("Illegal action " + str(action))
-
-        # Update Configuration
-        agentState = state.data.agentStates[agentIndex]
-        speed = 1.0
-        # if agentState.isPacman: speed = 0.5
-        vector = Actions.directionToVector(action, speed)
-        oldConfig = agentState.configuration
-        agentState.configuration = oldConfig.generateSuccessor(vector)
-
-        # Eat
-        next = agentState.configuration.getPosition()
-        nearest = nearestPoint(next)
-
-        if next == nearest:
-            isRed = state.isOnRedTeam(agentIndex)
-            # Change agent type
-            agentState.isPacman = [isRed, state.isRed(
-                agentState.configuration)].count(True) == 1
-            # if he's no longer pacman, he's on his own side, so reset the num carrying timer
-            #agentState.numCarrying *= int(agentState.isPacman)
-            if agentState.numCarrying > 0 and not agentState.isPacman:
-                score = agentState.numCarrying if isRed else -1*agentState.numCarrying
-                state.data.scoreChange += score
-
-                agentState.numReturned += agentState.numCarrying
-                agentState.numCarrying = 0
-
-                redCount = 0
-                blueCount = 0
-                for index in range(state.getNumAgents()):
-                    agentState = state.data.agentStates[index]
-                    if index in state.getRedTeamIndices():
-                        redCount += agentState.numReturned
-                    else:
-                        blueCount += agentState.numReturned
-                if redCount >= (TOTAL_FOOD/2) - MIN_FOOD or blueCount >= (TOTAL_FOOD/2) - MIN_FOOD:
-                    state.data._win = True
-
-        if agentState.isPacman and manhattanDistance(nearest, next) <= 0.9:
-            AgentRules.consume(nearest, state, state.isOnRedTeam(agentIndex))
-
-    applyAction = staticmethod(applyAction)
-
-    def consume(position, state, isRed):
-        x, y = position
-        # Eat food
-        if state.data.food[x][y]:
-
-            # blue case is the default
-            teamIndicesFunc = state.getBlueTeamIndices
-            score = -1
-            if isRed:
-                # switch if its red
-                score = 1
-                teamIndicesFunc = state.getRedTeamIndices
-
-            # go increase the variable for the pacman who ate this
-            agents = [state.data.agentStates[agentIndex]
-                      for agentIndex in teamIndicesFunc()]
-            i = 0
-            for agent in agents:
-                if agent.getPosition() == position:
-                    agent.numCarrying += 1
-                    agentIndex = teamIndicesFunc()[i]
-                    score = FOOD_POINTS
-                    if not state.isOnRedTeam(agentIndex):
-                        score = -score
-                    state.data.scoreChange += score
-                    break  # the above should only be true for one agent...
-                i += 1
-
-            # do all the score and food grid maintainenace
-            #state.data.scoreChange += score
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
-            state.data._foodEaten = position
-            # if (isRed and state.getBlueFood().count() == MIN_FOOD) or (not isRed and state.getRedFood().count() == MIN_FOOD):
-            #  state.data._win = True
-
-        # Eat capsule
-        if isRed:
-            myCapsules = state.getBlueCapsules()
-        else:
-            myCapsules = state.getRedCapsules()
-        if(position in myCapsules):
-            state.data.capsules.remove(position)
-            state.data._capsuleEaten = position
-
-            # Reset all ghosts' scared timers
-            if isRed:
-                otherTeam = state.getBlueTeamIndices()
-            else:
-                otherTeam = state.getRedTeamIndices()
-            for index in otherTeam:
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
-
-            # blue case is the default
-            teamIndicesFunc = state.getBlueTeamIndices
-            if isRed:
-                # switch if its red
-                teamIndicesFunc = state.getRedTeamIndices
-
-            agents = [state.data.agentStates[agentIndex]
-                      for agentIndex in teamIndicesFunc()]
-            i = 0
-            for agent in agents:
-                if agent.getPosition() == position:
-                    agentIndex = teamIndicesFunc()[i]
-                    score = CAPSULE_POINTS
-                    if not state.isOnRedTeam(agentIndex):
-                        score = -score
-                    state.data.scoreChange += score
-                    break  # the above should only be true for one agent...
-                i += 1
-
-    consume = staticmethod(consume)
-
-    def decrementTimer(state):
-        timer = state.scaredTimer
-        if timer == 1:
-            state.configuration.pos = nearestPoint(state.configuration.pos)
-        state.scaredTimer = max(0, timer - 1)
-    decrementTimer = staticmethod(decrementTimer)
-
-    def dumpFoodFromDeath(state, agentState, agentIndex):
-        if not (DUMP_FOOD_ON_DEATH):
-            # this feature is not turned on
-            return
-
-        if not agentState.isPacman:
-            raise Exception(
-                'something is seriously wrong, this agent isnt a pacman!')
-
-        # ok so agentState is this:
-        if (agentState.numCarrying == 0):
-            return
-
-        # first, score changes!
-        # we HACK pack that ugly bug by just determining if its red based on the first position
-        # to die...
-        dummyConfig = Configuration(agentState.getPosition(), 'North')
-        isRed = state.isRed(dummyConfig)
-
-        # the score increases if red eats dots, so if we are refunding points,
-        # the direction should be -1 if the red agent died, which means he dies
-        # on the blue side
-        scoreDirection = (-1)**(int(isRed) + 1)
-        #state.data.scoreChange += scoreDirection * agentState.numCarrying
-
-        def onRightSide(state, x, y):
-            dummyConfig = Configuration((x, y), 'North')
-            return state.isRed(dummyConfig) == isRed
-
-        # we have food to dump
-        # -- expand out in BFS. Check:
-        #   - that it's within the limits
-        #   - that it's not a wall
-        #   - that no other agents are there
-        #   - that no power pellets are there
-        #   - that it's on the right side of the grid
-        def allGood(state, x, y):
-            width, height = state.data.layout.width, state.data.layout.height
-            food, walls = state.data.food, state.data.layout.walls
-
-            # bounds check
-            if x >= width or y >= height or x <= 0 or y <= 0:
-                return False
-
-            if walls[x][y]:
-                return False
-            if food[x][y]:
-                return False
-
-            # dots need to be on the side where this agent will be a pacman :P
-            if not onRightSide(state, x, y):
-                return False
-
-            if (x, y) in state.data.capsules:
-                return False
-
-            # loop through agents
-            agentPoses = [state.getAgentPosition(
-                i) for i in range(state.getNumAgents())]
-            if (x, y) in agentPoses:
-                return False
-
-            return True
-
-        numToDump = agentState.numCarrying
-        state.data.food = state.data.food.copy()
-        foodAdded = []
-
-        def genSuccessors(x, y):
-            DX = [-1, 0, 1]
-            DY = [-1, 0, 1]
-            return [(x + dx, y + dy) for dx in DX for dy in DY]
-
-        # BFS graph search
-        positionQueue = [agentState.getPosition()]
-        seen = set()
-        while numToDump > 0:
-            if not len(positionQueue):
-                raise Exception('Exhausted BFS! uh oh')
-            # pop one off, graph check
-            popped = positionQueue.pop(0)
-            if popped in seen:
-                continue
-            seen.add(popped)
-
-            x, y = popped[0], popped[1]
-            x = int(x)
-            y = int(y)
-            if (allGood(state, x, y)):
-                state.data.food[x][y] = True
-                foodAdded.append((x, y))
-                numToDump -= 1
-
-            # generate successors
-            positionQueue = positionQueue + genSuccessors(x, y)
-
-        state.data._foodAdded = foodAdded
-        # now our agentState is no longer carrying food
-        agentState.numCarrying = 0
-        pass
-
-    dumpFoodFromDeath = staticmethod(dumpFoodFromDeath)
-
-    def checkDeath(state, agentIndex):
-        agentState = state.data.agentStates[agentIndex]
-        if state.isOnRedTeam(agentIndex):
-            otherTeam = state.getBlueTeamIndices()
-        else:
-            otherTeam = state.getRedTeamIndices()
-        if agentState.isPacman:
-            for index in otherTeam:
-                otherAgentState = state.data.agentStates[index]
-                if otherAgentState.isPacman:
-                    continue
-                ghostPosition = otherAgentState.getPosition()
-                if ghostPosition == None:
-                    continue
-                if manhattanDistance(ghostPosition, agentState.getPosition()) <= COLLISION_TOLERANCE:
-                    # award points to the other team for killing Pacmen
-                    if otherAgentState.scaredTimer <= 0:
-                        AgentRules.dumpFoodFromDeath(
-                            state, agentState, agentIndex)
-
-                        score = KILL_POINTS
-                        if state.isOnRedTeam(agentIndex):
-                            score = -score
-                        state.data.scoreChange += score
-                        agentState.isPacman = False
-                        agentState.configuration = agentState.start
-                        agentState.scaredTimer = 0
-                    else:
-                        score = KILL_POINTS
-                        if state.isOnRedTeam(agentIndex):
-                            score = -score
-                        state.data.scoreChange += score
-                        otherAgentState.isPacman = False
-                        otherAgentState.configuration = otherAgentState.start
-                        otherAgentState.scaredTimer = 0
-        else:  # Agent is a ghost
-            for index in otherTeam:
-                otherAgentState = state.data.agentStates[index]
-                if not otherAgentState.isPacman:
-                    continue
-                pacPos = otherAgentState.getPosition()
-                if pacPos == None:
-                    continue
-                if manhattanDistance(pacPos, agentState.getPosition()) <= COLLISION_TOLERANCE:
-                    # award points to the other team for killing Pacmen
-                    if agentState.scaredTimer <= 0:
-                        AgentRules.dumpFoodFromDeath(
-                            state, otherAgentState, agentIndex)
-
-                        score = KILL_POINTS
-                        if not state.isOnRedTeam(agentIndex):
-                            score = -score
-                        state.data.scoreChange += score
-                        otherAgentState.isPacman = False
-                        otherAgentState.configuration = otherAgentState.start
-                        otherAgentState.scaredTimer = 0
-                    else:
-                        score = KILL_POINTS
-                        if state.isOnRedTeam(agentIndex):
-                            score = -score
-                        state.data.scoreChange += score
-                        agentState.isPacman = False
-                        agentState.configuration = agentState.start
-                        agentState.scaredTimer = 0
-    checkDeath = staticmethod(checkDeath)
-
-    def placeGhost(state, ghostState):
-        ghostState.configuration = ghostState.start
-    placeGhost = staticmethod(placeGhost)
-
 #############################
 # FRAMEWORK TO START A GAME #
 #############################
@@ -884,13 +883,29 @@ def readCommand(argv):
     parser.add_option('-f', '--fixRandomSeed', action='store_true',
                       help='Fixes the random seed to always play the same game', default=False)
     parser.add_option('--record', action='store_true',
-                      help='Writes game histories to a file (named by the time they were played)', default=False)
+                      help='Writes each game to a replay file (replay-0, replay-1, ...). Each '
+                           'recorded game is played with its own random seed, saved in the file; '
+                           'the global random state is put back after it, so later games are not affected',
+                      default=False)
     parser.add_option('--replay', default=None,
                       help='Replays a recorded game file.')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
                       help=default('How many episodes are training (suppresses output)'), default=0)
     parser.add_option('-c', '--catchExceptions', action='store_true', default=False,
                       help='Catch exceptions and enforce time limits')
+    parser.add_option('--hostAgents', action='store_true', default=False,
+                      help='Run each (non keyboard) agent in a process of its own')
+    parser.add_option('--threadedDisplay', action='store_true', default=False,
+                      help='Draw in a thread of its own, dropping frames instead of slowing the game')
+    parser.add_option('--parallel', type='int', default=0, metavar='N',
+                      help='Play a tournament on N processes: NUMGAMES seeds on every layout '
+                           '(a comma separated list, or ALL; RANDOM plays each seed on a maze '
+                           'of its own), each from both sides, without graphics')
+    parser.add_option('--sensors', choices=['board', 'features'], default='board',
+                      help=default('The sensors of the genomes being optimized (board or features)'))
+    parser.add_option('--distanceCache', default=None, metavar='DIR',
+                      help='Save maze distances in DIR (e.g. ~/.cache/pacman/distances) and reuse '
+                           'them in later runs; off by default, and never cleaned up')
 
     options, otherjunk = parser.parse_args(argv)
     assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
@@ -903,7 +918,7 @@ def readCommand(argv):
     if options.textgraphics:
         import textDisplay
         args['display'] = textDisplay.PacmanGraphics()
-    elif options.quiet:
+    elif options.quiet or options.parallel > 0:
         import textDisplay
         args['display'] = textDisplay.NullGraphics()
     elif options.super_quiet:
@@ -916,6 +931,11 @@ def readCommand(argv):
         captureGraphicsDisplay.FRAME_TIME = 0
         args['display'] = captureGraphicsDisplay.PacmanGraphics(
             options.red, options.blue, options.zoom, 0, capture=True)
+        if options.threadedDisplay:
+            if options.keys0 or options.keys1 or options.keys2 or options.keys3:
+                raise Exception('Keyboard agents can\'t be used with a threaded display')
+            import threadedDisplay
+            args['display'] = threadedDisplay.ThreadedDisplay(args['display'])
         import __main__
         __main__.__dict__['_display'] = args['display']
 
@@ -925,13 +945,19 @@ def readCommand(argv):
     if options.fixRandomSeed:
         random.seed('cs188')
 
+    if options.distanceCache is not None:
+        import os
+        import distanceCalculator
+        directory = os.path.expanduser(options.distanceCache)
+        distanceCalculator.CACHE_DIRECTORY = directory
+        # Worker processes that don't fork read it from the environment
+        os.environ['PACMAN_DISTANCE_CACHE'] = directory
+
     # Special case: recorded games don't use the runGames method or args structure
     if options.replay != None:
         print('Replaying recorded game %s.' % options.replay)
-        import pickle
-        recorded = pickle.load(open(options.replay))
-        recorded['display'] = args['display']
-        replayGame(**recorded)
+        import recording
+        replayGame(recording.ReplayReader(options.replay), args['display'])
         sys.exit(0)
 
     # Choose a pacman agent
@@ -940,6 +966,15 @@ def readCommand(argv):
     if options.numTraining > 0:
         redArgs['numTraining'] = options.numTraining
         blueArgs['numTraining'] = options.numTraining
+
+    # Special case: tournaments play each game in a worker process
+    if options.parallel > 0:
+        runTournament(tournamentLayouts(options.layout, options.numGames),
+                      ((options.red, redArgs), (options.blue, blueArgs)),
+                      options.time, options.parallel,
+                      (options.red_name, options.blue_name), options.catchExceptions)
+        sys.exit(0)
+
     nokeyboard = options.textgraphics or options.quiet or options.numTraining > 0
     print('\nRed team %s with %s:' % (options.red, redArgs))
     redAgents = loadAgents(True, options.red, nokeyboard, redArgs)
@@ -961,6 +996,12 @@ def readCommand(argv):
         numKeyboardAgents += 1
         args['agents'][index] = agent
 
+    if options.hostAgents:
+        import agentHost
+        args['agents'] = [agentHost.AgentHost(agent)
+                          if agent is not None and not isinstance(agent, keyboardAgents.KeyboardAgent)
+                          else agent for agent in args['agents']]
+
     # Choose a layout
     import layout
     layouts = []
@@ -986,6 +1027,7 @@ def readCommand(argv):
     args['numTraining'] = options.numTraining
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
+    args['sensors'] = options.sensors
     return args
 
 
@@ -1035,17 +1077,25 @@ def loadAgents(isRed, factory, textgraphics, cmdLineArgs):
     return createTeamFunc(indices[0], indices[1], isRed, **args)
 
 
-def replayGame(layout, agents, actions, display, length, redTeamName, blueTeamName):
+def replayGame(replay, display):
+    """
+    Shows a game recorded with --record, read from a recording.ReplayReader.
+    """
     rules = CaptureRules()
-    # game = rules.newGame(layout, agents, display, length, False, False)
-    state = game.state
-    display.redTeam = redTeamName
-    display.blueTeam = blueTeamName
+    layout = replay.getLayout()
+    agents = [Agent(i) for i in range(replay.numAgents)]
+    game = rules.newGame(layout, agents, display, replay.length, False, False)
+    state = replay.getState(0)
+    game.state = state
+    display.redTeam = replay.redTeamName
+    display.blueTeam = replay.blueTeamName
     display.initialize(state.data)
 
-    for action in actions:
+    for action in replay.moves():
         # Execute the action
         state = state.generateSuccessor(*action)
+        game.moveHistory.append(action)
+        game.state = state
         # Change the display
         display.update(state.data)
         # Allow for game specific conditions (winning, losing, etc.)
@@ -1054,10 +1104,14 @@ def replayGame(layout, agents, actions, display, length, redTeamName, blueTeamNa
     display.finish()
 
 
-def runGames(layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False, optimize=False):
+def runGames(layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False, optimize=False, sensors='board'):
 
     rules = CaptureRules()
     games = []
+    # The seeds of recorded games come from a copy of the global stream, so
+    # --fixRandomSeed still records the same games without drawing from it
+    recordSeeds = random.Random()
+    recordSeeds.setstate(random.getstate())
 
     if numTraining > 0:
         print('Playing %d training games' % numTraining)
@@ -1077,29 +1131,34 @@ def runGames(layouts, agents, display, length, numGames, record, numTraining, re
         ###################
         # TODO: properly integrate options for running optimization
         optimizerRunner = geneticOptimizer.Runner(
-            layout, gameDisplay, length, muteAgents, catchExceptions)
+            layout, gameDisplay, length, muteAgents, catchExceptions, sensors)
         optimizerRunner.run()
         ###################
+        recorder = None
+        if record:
+            import recording
+            # Play the game from a seed of its own so the recorded seed
+            # reproduces it, and put the global stream back afterwards
+            seed = recordSeeds.randint(0, 2 ** 32 - 1)
+            randomState = random.getstate()
+            random.seed(seed)
+            recorder = recording.ReplayWriter('replay-%d' % i, layout, len(agents), length,
+                                              seed, redTeamName, blueTeamName)
         g = rules.newGame(layout, agents, gameDisplay,
-                          length, muteAgents, catchExceptions)
-        g.run()
+                          length, muteAgents, catchExceptions, recorder)
+        try:
+            g.run()
+        finally:
+            if recorder is not None:
+                recorder.close(g.state)
+                random.setstate(randomState)
         if not beQuiet:
             games.append(g)
 
         g.record = None
         if record:
-            import time
-            import pickle
-            import game
-            #fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            #f = file(fname, 'w')
-            components = {'layout': layout, 'agents': [game.Agent(
-            ) for a in agents], 'actions': g.moveHistory, 'length': length, 'redTeamName': redTeamName, 'blueTeamName': blueTeamName}
-            # f.close()
             print("recorded")
-            g.record = pickle.dumps(components)
-            with open('replay-%d' % i, 'wb') as f:
-                f.write(g.record)
+            g.record = recorder.path
 
     if numGames > 1:
         scores = [game.state.data.score for game in games]
@@ -1115,6 +1174,189 @@ def runGames(layouts, agents, display, length, numGames, record, numTraining, re
             [('Blue', 'Tie', 'Red')[max(0, min(2, 1 + s))] for s in scores]))
     return games
 
+###############
+# Tournaments #
+###############
+
+
+def tournamentLayouts(names, numGames):
+    """
+    Turns a --layout argument into the (layout name, seeds) pairs a
+    tournament is played on: a comma separated list of layouts, ALL for
+    every capture layout in layouts/, each played with seeds 0 to
+    numGames - 1, or RANDOM for a new random maze for every seed, played
+    with that seed only.
+    """
+    import os
+    seeds = list(range(numGames))
+    if names == 'ALL':
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts')
+        return [(name[:-4], seeds) for name in sorted(os.listdir(directory))
+                if name.endswith('Capture.lay')]
+    layouts = []
+    for name in names.split(','):
+        if name == 'RANDOM':
+            layouts.extend(('RANDOM%d' % random.randint(1, 99999999), [seed])
+                           for seed in seeds)
+        elif not name.startswith('RANDOM') and name.lower().find('capture') == -1:
+            raise Exception('You must use a capture layout with capture.py')
+        else:
+            layouts.append((name, seeds))
+    return layouts
+
+
+# Layouts loaded by this tournament worker
+_tournamentLayouts = {}
+
+
+def _loadTournamentLayout(name):
+    l = _tournamentLayouts.get(name)
+    if l is None:
+        import layout
+        if name.startswith('RANDOM'):
+            l = layout.Layout(randomLayout(int(name[6:])).split('\n'))
+        else:
+            l = layout.getLayout(name)
+        if l == None:
+            raise Exception("The layout " + name + " cannot be found")
+        _tournamentLayouts[name] = l
+    return l
+
+
+def _initTournamentWorker(sharedDistances):
+    util.mutePrint()
+    import distanceCalculator
+    distanceCalculator.attachDistances(sharedDistances)
+
+
+def _playTournamentGame(job, teams, length, catchExceptions):
+    """
+    Plays one tournament game in a worker process and returns its result,
+    with the score from the first team's point of view.
+    """
+    import textDisplay
+    layoutName, seed, swapped = job
+    red, blue = (teams[1], teams[0]) if swapped else teams
+    random.seed(seed)
+    redAgents = loadAgents(True, red[0], True, dict(red[1]))
+    blueAgents = loadAgents(False, blue[0], True, dict(blue[1]))
+    agents = sum([list(el) for el in zip(redAgents, blueAgents)], [])
+    rules = CaptureRules(quiet=True)
+    game = rules.newGame(_loadTournamentLayout(layoutName), agents, textDisplay.NullGraphics(),
+                         length, True, catchExceptions)
+    start = time.time()
+    game.run()
+    score = game.state.data.score
+    if swapped:
+        score = -score or 0.0
+    return {'layout': layoutName, 'seed': seed, 'swapped': swapped,
+            'score': score, 'crashed': game.agentCrashed,
+            'endReason': game.endReason, 'moves': len(game.moveHistory),
+            'time': time.time() - start}
+
+
+def _meanInterval(values, z=1.96):
+    "The mean of values and the half width of its normal confidence interval"
+    n = len(values)
+    mean = sum(values) / float(n)
+    if n < 2:
+        return mean, 0.0
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    return mean, z * (variance / n) ** 0.5
+
+
+def _wilsonInterval(successes, n, z=1.96):
+    "The Wilson score interval of a rate of successes out of n"
+    if n == 0:
+        return 0.0, 0.0
+    p = successes / float(n)
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    halfWidth = z * (p * (1 - p) / n + z * z / (4 * n * n)) ** 0.5 / denominator
+    return max(0.0, centre - halfWidth), min(1.0, centre + halfWidth)
+
+
+def runTournament(layouts, teams, length, parallel,
+                  teamNames=('Red', 'Blue'), catchExceptions=False):
+    """
+    Plays every (layout name, seeds) pair of layouts (see
+    tournamentLayouts), each seed once from each side, spreading the games
+    over parallel processes.  teams holds the (factory, options) of the two
+    teams; results are reported from the first team's point of view as the
+    games finish, then summarized overall and per layout.
+
+    Returns the results, in (layout, seed, side) order.
+    """
+    import concurrent.futures
+    import distanceCalculator
+    layoutNames = [layoutName for layoutName, seeds in layouts]
+    jobs = [(layoutName, seed, swapped) for layoutName, seeds in layouts
+            for seed in seeds for swapped in (False, True)]
+    nameA, nameB = teamNames
+    print('Playing %d games (%d layouts, %d layout and seed pairs x 2 sides) on %d processes' %
+          (len(jobs), len(layoutNames), len(jobs) // 2, parallel))
+
+    start = time.time()
+    results = [None] * len(jobs)
+    errors = 0
+    sharedDistances = distanceCalculator.publishDistances(
+        [_loadTournamentLayout(layoutName) for layoutName in layoutNames])
+    with concurrent.futures.ProcessPoolExecutor(parallel, initializer=_initTournamentWorker,
+                                                initargs=(sharedDistances,)) as pool:
+        futures = dict((pool.submit(_playTournamentGame, job, teams, length, catchExceptions), i)
+                       for i, job in enumerate(jobs))
+        for done, future in enumerate(concurrent.futures.as_completed(futures)):
+            i = futures[future]
+            layoutName, seed, swapped = jobs[i]
+            prefix = '[%*d/%d] %s seed %d, %s as %s:' % (
+                len(str(len(jobs))), done + 1, len(jobs), layoutName, seed,
+                nameA, 'blue' if swapped else 'red')
+            try:
+                result = future.result()
+            except Exception as e:
+                errors += 1
+                print(prefix, 'failed (%s: %s)' % (type(e).__name__, e))
+                continue
+            results[i] = result
+            print(prefix, result['score'],
+                  '(crash)' if result['crashed'] else '(%s)' % result['endReason'])
+    elapsed = time.time() - start
+    results = [result for result in results if result is not None]
+
+    print('\nPlayed %d games in %.1fs (%.2f games/s)%s' %
+          (len(results), elapsed, len(results) / max(elapsed, 1e-9),
+           ', %d failed' % errors if errors else ''))
+    if not results:
+        return results
+    scores = [result['score'] for result in results]
+    wins = [s > 0 for s in scores].count(True)
+    losses = [s < 0 for s in scores].count(True)
+    mean, halfWidth = _meanInterval(scores)
+    print('Average Score: %s (95%% CI %.2f to %.2f)' % (mean, mean - halfWidth, mean + halfWidth))
+    print('Scores:       ', ', '.join([str(score) for score in scores]))
+    for name, count in ((nameA, wins), (nameB, losses)):
+        low, high = _wilsonInterval(count, len(scores))
+        print('%-15s%d/%d (%.2f, 95%% CI %.2f to %.2f)' %
+              (name + ' Win Rate:', count, len(scores), count / float(len(scores)), low, high))
+    print('Record:       ', ', '.join(
+        [nameA if s > 0 else nameB if s < 0 else 'Tie' for s in scores]))
+    crashes = [result['crashed'] for result in results].count(True)
+    if crashes:
+        print('Crashes:       %d' % crashes)
+
+    print('\n%-20s %5s %26s %5s %5s %5s' % ('Layout', 'Games', 'Average Score (95% CI)',
+                                          nameA[:5], 'Tie', nameB[:5]))
+    for layoutName in layoutNames:
+        layoutScores = [result['score'] for result in results if result['layout'] == layoutName]
+        if not layoutScores:
+            continue
+        mean, halfWidth = _meanInterval(layoutScores)
+        print('%-20s %5d %10.2f (%6.2f to %6.2f) %5d %5d %5d' % (
+            layoutName, len(layoutScores), mean, mean - halfWidth, mean + halfWidth,
+            [s > 0 for s in layoutScores].count(True), [s == 0 for s in layoutScores].count(True),
+            [s < 0 for s in layoutScores].count(True)))
+    return results
+
 
 def save_score(game):
     with open('score', 'w') as f:
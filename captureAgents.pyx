@@ -17,12 +17,14 @@
 """
 
 from genes import Genes
-from game import Agent
+from game import Agent, Actions, Directions
 import distanceCalculator
+import potentialFields
 from util import nearestPoint
 import util
 import numpy as np
 import random
+from collections import deque
 
 # Note: the following class is not used, but is kept for backwards
 # compatibility with team submissions that try to import it.
@@ -129,6 +131,8 @@ class CaptureAgent(Agent):
     def observationFunction(self, gameState):
         " Changing this won't affect pacclient.py, but will affect capture.py "
         return gameState.makeObservation(self.index)
+    # makeObservation copies, so the game needn't (see game.Game.run)
+    observationFunction.copiesState = True
 
     def debugDraw(self, cells, color, clear=False):
 
@@ -219,9 +223,9 @@ class CaptureAgent(Agent):
         of the agents (e.g., red might be "1,3,5")
         """
         if self.red:
-            return gameState.getBlueTeamIndices()
+            return list(gameState.blueTeam)
         else:
-            return gameState.getRedTeamIndices()
+            return list(gameState.redTeam)
 
     def getTeam(self, gameState):
         """
@@ -229,9 +233,9 @@ class CaptureAgent(Agent):
         of the agents (e.g., red might be the list of 1,3,5)
         """
         if self.red:
-            return gameState.getRedTeamIndices()
+            return list(gameState.redTeam)
         else:
-            return gameState.getBlueTeamIndices()
+            return list(gameState.blueTeam)
 
     def getScore(self, gameState):
         """
@@ -255,6 +259,33 @@ class CaptureAgent(Agent):
         d = self.distancer.getDistance(pos1, pos2)
         return d
 
+    def getFields(self, gameState):
+        """
+        Returns the potentialFields.LayoutFields of the game, up to date with
+        gameState: maps of the distance from any cell to the nearest food,
+        capsule or home border cell of either side.
+        """
+        return potentialFields.getFields(gameState)
+
+    def getFoodField(self, gameState):
+        """
+        The field of the food you are meant to eat, so
+        getFoodField(gameState).getDistance(pos) is the maze distance from
+        pos to the nearest of it.
+        """
+        fields = potentialFields.getFields(gameState)
+        return fields.blueFood if self.red else fields.redFood
+
+    def getCapsuleField(self, gameState):
+        "The field of the capsules you can eat"
+        fields = potentialFields.getFields(gameState)
+        return fields.blueCapsules if self.red else fields.redCapsules
+
+    def getHomeField(self, gameState):
+        "The field of the cells on your side of the border, where food is returned"
+        fields = potentialFields.getFields(gameState)
+        return fields.redBorder if self.red else fields.blueBorder
+
     def getPreviousObservation(self):
         """
         Returns the GameState object corresponding to the last state this agent saw
@@ -317,11 +348,83 @@ class TimeoutAgent(Agent):
         return random.choice(state.getLegalActions(self.index))
 
 
+class StallDetector:
+    """
+    Watches the last `window` turns of an agent and reports it as stalled when
+    it has stood on at most `maxCells` cells over all of them, without picking
+    up or returning food: the agent is standing still or oscillating. Call
+    reset() when the agent starts over (a new game, or a respawn).
+    """
+
+    def __init__(self, window=25, maxCells=2):
+        self.maxCells = maxCells
+        self.positions = deque(maxlen=window)
+        self.carrying = deque(maxlen=window)
+
+    def record(self, position, numCarrying):
+        self.positions.append(position)
+        self.carrying.append(numCarrying)
+
+    def lastPosition(self):
+        return self.positions[-1] if self.positions else None
+
+    def isStalled(self):
+        if len(self.positions) < self.positions.maxlen:
+            return False
+        return len(set(self.positions)) <= self.maxCells and \
+            len(set(self.carrying)) == 1
+
+    def reset(self):
+        self.positions.clear()
+        self.carrying.clear()
+
+
+# The moves North, South, East and West as each team sees the board (blue
+# sees it turned around), in the order of the genome outputs
+_RED_DIRECTIONS = [tuple(map(int, Actions.directionToVector(direction))) for direction in
+                   (Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST)]
+_BLUE_DIRECTIONS = [tuple(map(int, Actions.directionToVector(direction))) for direction in
+                    (Directions.SOUTH, Directions.NORTH, Directions.WEST, Directions.EAST)]
+
+
 class GenesAgent(CaptureAgent):
+    """
+    Plays by running a genome.  Its sensors are one of SENSOR_PROFILES:
+
+      'board'     the whole (32 x 16) board, a value per cell, then the
+                  agent positions, whether the other team is scared and the
+                  food carried (see _makeInput)
+      'features'  a few dozen features worked out from maze distances: for
+                  each direction, how close the nearest food, capsule,
+                  enemy, teammate and home cell are and how far the way is
+                  clear, then the food carried, whether the agent is a
+                  Pacman, the scared timers and the score (see _makeFeatures)
+
+    The outputs are the values of moving North, South, East, West and
+    stopping, seen from the agent's side of the board.
+    """
 
-    def __init__(self, index, genes=None):
+    SENSOR_PROFILES = ('board', 'features')
+    BOARD_INPUTS = 16 * 32 + 8 + 2
+    # Six per direction, four for the agent and the score, and a scared timer
+    # for each opponent (capture teams are two agents; _makeFeatures checks)
+    NUM_OPPONENTS = 2
+    FEATURE_INPUTS = 4 * 6 + 4 + NUM_OPPONENTS
+
+    def numInputs(sensors='board'):
+        "The number of inputs of a genome for the given sensor profile"
+        if sensors == 'board':
+            return GenesAgent.BOARD_INPUTS
+        if sensors == 'features':
+            return GenesAgent.FEATURE_INPUTS
+        raise Exception('Unknown sensor profile %s' % sensors)
+    numInputs = staticmethod(numInputs)
+
+    def __init__(self, index, genes=None, stallWindow=25, sensors='board'):
+        numInputs = GenesAgent.numInputs(sensors)
+        self.sensors = sensors
         if genes is None:
-            self.genes = Genes(16 * 32 + 8 + 2, 5, Genes.Metaparameters())
+            self.genes = Genes(numInputs, 5, Genes.Metaparameters())
         else:
             self.genes = genes
         # for i in range(0, 1000):
@@ -329,84 +432,222 @@ class GenesAgent(CaptureAgent):
         self.neurons = None
         self.startingPos = None
         self.maxPathDist = 0
-        self.prevPosList = []
+        self.stallDetector = StallDetector(stallWindow)
         self.numCarried = 0
         self.prevNumCarrying = 0
         CaptureAgent.__init__(self, index)
 
-    def _makeInput(self, gameState):
+    def registerInitialState(self, gameState):
+        CaptureAgent.registerInitialState(self, gameState)
+        self.stallDetector.reset()
+        self._prepareInput(gameState)
+
+    def _prepareInput(self, gameState):
+        """
+        Precomputes what the sensors of every turn have in common: the walls,
+        and where each cell goes in the input (blue agents see the board
+        turned around, so cell x * height + y is input total - 1 - that).
+        """
         walls = gameState.getWalls()
-        capsules = gameState.getCapsules()
-        width = gameState.getWalls().width
-        height = gameState.getWalls().height
+        self._inputWidth = width = walls.width
+        self._inputHeight = height = walls.height
+        total = width * height
+        wallPlane = np.array(walls.data, dtype=np.float64).ravel()
+        self._wallPlane = wallPlane if self.red else wallPlane[::-1].copy()
+        self._input = np.zeros(total + 8 + 2, dtype=np.float64)
+        self._foodIndices = [None, None]
+        self._foodPlanes = [None, None]
+        self._liveInputs = None
+
+    def _prepareLiveInputs(self):
+        """
+        Works out where each input the genome uses comes from: for a cell,
+        its neuron, position, the value it has when it holds food and the
+        value it has otherwise (1 wall, 0 open); for the inputs after the
+        cells, their neuron and index in _otherInputs.
+        """
+        live = self.genes.live_input_indices()
+        width = self._inputWidth
+        height = self._inputHeight
+        total = width * height
+        halfway = int(width / 2)
+        assert self.genes._num_sensors == total + 8 + 2, "invalid number of inputs"
+        self._liveCells = []
+        self._liveOthers = []
+        for index in live:
+            neuron = self.genes.input_node_index(index)
+            if index < total:
+                x, y = divmod(index if self.red else total - 1 - index, height)
+                self._liveCells.append((neuron, (x, y), x, y, 2.0 if x < halfway else 3.0,
+                                        float(self._wallPlane[index])))
+            else:
+                self._liveOthers.append((neuron, index - total))
+        self._liveInputs = live
+
+    def _cellIndices(self, positions):
+        "The inputs of the cells at positions"
+        height = self._inputHeight
+        indices = np.fromiter([x * height + y for x, y in positions], dtype=np.intp,
+                              count=len(positions))
+        if not self.red:
+            indices = self._inputWidth * height - 1 - indices
+        return indices
+
+    def _makeInput(self, gameState):
+        """
+        The sensor values for gameState: a value per cell (1 wall, 2 red food,
+        3 blue food, 4 capsule), the positions of the agents (team first,
+        (-1, -1) when unseen), whether the other team is scared and how much
+        food this agent carries.  Returns a buffer that is reused every turn.
+        """
+        if getattr(self, '_input', None) is None:
+            self._prepareInput(gameState)
+        width = self._inputWidth
+        height = self._inputHeight
+        total = width * height
         # make num food carrying / has swallowed capsules an input?
         # theoretically the agent could learn this through recurrent connections (i.e. memory), but the probability
         # of this occuring seems extremely low
-        ret = [0] * (8 + width * height + 2)
+        ret = self._input
+        ret[:total] = self._wallPlane
+        for side, (food, value) in enumerate(((gameState.getRedFood(), 2), (gameState.getBlueFood(), 3))):
+            # Food is never changed once shared, so the same food has the same inputs
+            if food is not self._foodPlanes[side]:
+                self._foodPlanes[side] = food
+                self._foodIndices[side] = self._cellIndices(food.asList())
+            ret[self._foodIndices[side]] = value
+        capsules = gameState.data.capsules
+        if capsules:
+            ret[self._cellIndices(capsules)] = 4
+        ret[total:] = self._otherInputs(gameState)
+        return ret
+
+    def _otherInputs(self, gameState):
+        """
+        The sensor values after the cells: the agent positions, whether the
+        other team is scared and how much food this agent carries.
+        """
+        width = self._inputWidth
+        height = self._inputHeight
         if self.red:
-            team = gameState.getRedTeamIndices()
-            enemy = gameState.getBlueTeamIndices()
-            food = gameState.getRedFood()
-            food2 = gameState.getBlueFood()
-            for x in range(width):
-                for y in range(height):
-                    if walls[x][y]:
-                        ret[x * height + y] = 1
-                    elif food[x][y]:
-                        ret[x * height + y] = 2
-                    elif food2[x][y]:
-                        ret[x * height + y] = 3
-            for x, y in capsules:
-                ret[x * height + y] = 4
+            team = gameState.redTeam
+            enemy = gameState.blueTeam
         else:
-            enemy = gameState.getRedTeamIndices()
-            team = gameState.getBlueTeamIndices()
-            food = gameState.getRedFood()
-            food2 = gameState.getBlueFood()
-            for x in range(width):
-                for y in range(height):
-                    coord = (width - x) * height - y - 1
-                    if walls[x][y]:
-                        ret[coord] = 1
-                    elif food[x][y]:
-                        ret[coord] = 2
-                    elif food2[x][y]:
-                        ret[coord] = 3
-            for x, y in capsules:
-                ret[(width - x) * height - y - 1] = 4
-        total = width * height
+            enemy = gameState.redTeam
+            team = gameState.blueTeam
 
-        def assignPosition(arrayIndex, agentIndex):
+        agentStates = gameState.data.agentStates
+        ret = []
+        for agentIndex in team + enemy:
             position = gameState.getAgentPosition(agentIndex)
             if position is None:
-                ret[arrayIndex] = -1
-                ret[arrayIndex + 1] = -1
+                ret += [-1.0, -1.0]
+            elif self.red:
+                ret += [float(position[0]), float(position[1])]
             else:
-                if (self.red):
-                    ret[arrayIndex] = position[0]
-                    ret[arrayIndex+1] = position[1]
-                else:
-                    ret[arrayIndex] = width - position[0] - 1
-                    ret[arrayIndex+1] = height - position[1] - 1
-        assignPosition(total, team[0])
-        assignPosition(total + 2, team[1])
-        assignPosition(total + 4, enemy[0])
-        assignPosition(total + 6, enemy[1])
+                ret += [float(width - position[0] - 1), float(height - position[1] - 1)]
 
         # Last two inputs are whether the other team is scared (0, 1) and num carrying (0, 20)
-        ret[-1] = gameState.data.agentStates[self.index].numCarrying
-        isScary = 0
-        if self.red:
-            otherTeam = gameState.getBlueTeamIndices()
-        else:
-            otherTeam = gameState.getRedTeamIndices()
-        for index in otherTeam:
-            if gameState.data.agentStates[index].scaredTimer > 0:
-                isScary = 1
+        isScary = 0.0
+        for index in enemy:
+            if agentStates[index].scaredTimer > 0:
+                isScary = 1.0
                 break
-        ret[-2] = isScary
+        ret.append(isScary)
+        ret.append(float(agentStates[self.index].numCarrying))
         return ret
 
+    def _feedLiveInputs(self, gameState):
+        """
+        Runs the genome on gameState, working out only the sensor values of
+        the inputs it has connections from (see Genes.live_input_indices)
+        and writing them straight into its neurons.  Gives the same outputs
+        as feeding it the whole of _makeInput.
+        """
+        genes = self.genes
+        if getattr(self, '_input', None) is None:
+            self._prepareInput(gameState)
+        if self._liveInputs is not genes.live_input_indices():
+            self._prepareLiveInputs()
+        neurons = self.neurons
+        if neurons is None or len(neurons) != genes.total_nodes() + 1:
+            neurons = self.neurons = genes.new_neurons()
+        food = gameState.data.food.data
+        capsules = gameState.data.capsules
+        for neuron, position, x, y, foodValue, value in self._liveCells:
+            if position in capsules:
+                value = 4.0
+            elif food[x][y]:
+                value = foodValue
+            neurons[neuron] = value
+        if self._liveOthers:
+            others = self._otherInputs(gameState)
+            for neuron, index in self._liveOthers:
+                neurons[neuron] = others[index]
+        return genes.activate(neurons)
+
+    def _makeFeatures(self, gameState):
+        """
+        The sensor values of the 'features' profile.  For each direction
+        (North, South, East, West as the agent sees the board), from the
+        cell that move leads to: how close the nearest food to eat, capsule
+        to eat, seen enemy, teammate and home cell are (1 / (1 + distance),
+        0 when there is none or the way is a wall) and how far the way is
+        clear (1 / (1 + open cells before a wall)).  Then the food carried
+        (/ 20), whether the agent is a Pacman, its scared timer and the
+        other team's (/ 40) and the score (/ 20), all for this agent's team.
+        """
+        if getattr(self, '_input', None) is None:
+            self._prepareInput(gameState)
+        walls = gameState.getWalls()
+        distancer = self.distancer
+        foodField = self.getFoodField(gameState)
+        capsuleField = self.getCapsuleField(gameState)
+        homeField = self.getHomeField(gameState)
+        agentStates = gameState.data.agentStates
+        x, y = gameState.getAgentPosition(self.index)
+        enemies = [gameState.getAgentPosition(index) for index in self.getOpponents(gameState)]
+        enemies = [position for position in enemies if position is not None]
+        teammates = [gameState.getAgentPosition(index) for index in self.getTeam(gameState)
+                     if index != self.index]
+        teammates = [position for position in teammates if position is not None]
+
+        def closeness(distance):
+            return 1.0 / (1 + distance)
+
+        features = []
+        directions = _RED_DIRECTIONS if self.red else _BLUE_DIRECTIONS
+        for dx, dy in directions:
+            nextX, nextY = x + dx, y + dy
+            if walls[nextX][nextY]:
+                features += [0.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+                continue
+            nextPos = (nextX, nextY)
+            for field in (foodField, capsuleField):
+                distance = field.getDistance(nextPos)
+                features.append(0.0 if distance >= field.default else closeness(distance))
+            for positions in (enemies, teammates):
+                if positions:
+                    features.append(closeness(min(distancer.getDistance(nextPos, position)
+                                                  for position in positions)))
+                else:
+                    features.append(0.0)
+            features.append(closeness(homeField.getDistance(nextPos)))
+            clear = 1
+            while not walls[nextX + dx * clear][nextY + dy * clear]:
+                clear += 1
+            features.append(closeness(clear))
+
+        myState = agentStates[self.index]
+        features.append(myState.numCarrying / 20.0)
+        features.append(1.0 if myState.isPacman else 0.0)
+        features.append(myState.scaredTimer / 40.0)
+        for index in self.getOpponents(gameState):
+            features.append(agentStates[index].scaredTimer / 40.0)
+        features.append(self.getScore(gameState) / 20.0)
+        assert len(features) == GenesAgent.FEATURE_INPUTS, "invalid number of inputs"
+        return features
+
     def chooseAction(self, gameState):
         curPos = gameState.getAgentPosition(self.index)
         if self.startingPos is None:
@@ -414,18 +655,12 @@ class GenesAgent(CaptureAgent):
         curPathDist = self.getMazeDistance(curPos, self.startingPos)
         if curPathDist > self.maxPathDist:
             self.maxPathDist = curPathDist
-        # self.prevPosList.append(curPos)
-        # if len(self.prevPosList) > 25:
-        #     # Error if in same two spots for 25 positions
-        #     pos = self.prevPosList[0]
-        #     allEqual = True
-        #     for p in self.prevPosList:
-        #         if p[0] != pos[0] and p[1] != pos[1]:
-        #             allEqual = False
-        #             break
-        #     if allEqual:
-        #         raise Exception("Agent idle. Game terminating.")
-        #     self.prevPosList.pop(0)
+        lastPos = self.stallDetector.lastPosition()
+        if lastPos is not None and util.manhattanDistance(lastPos, curPos) > 1:
+            # Moved more than a cell since our last turn: we were eaten and respawned
+            self.stallDetector.reset()
+        self.stallDetector.record(
+            curPos, gameState.data.agentStates[self.index].numCarrying)
         """
         curNumCarrying = gameState.data.agentStates[self.index].numCarrying
         if curNumCarrying > self.prevNumCarrying:
@@ -433,8 +668,11 @@ class GenesAgent(CaptureAgent):
         self.prevNumCarrying = curNumCarrying
         """
 
-        self.neurons = self.genes.feed_sensor_values(
-            self._makeInput(gameState), self.neurons)
+        if self.sensors == 'features':
+            self.neurons = self.genes.feed_sensor_values(
+                self._makeFeatures(gameState), self.neurons)
+        else:
+            self.neurons = self._feedLiveInputs(gameState)
         output = self.genes.extract_output_values(self.neurons)
         if self.red:
             values = {"North": output[0], "South": output[1],
@@ -445,3 +683,10 @@ class GenesAgent(CaptureAgent):
         legalActions = gameState.getLegalActions(self.index)
         action = max(legalActions, key=lambda dir: values[dir])
         return action
+
+    def isStalled(self):
+        """
+        True when this agent has been standing still or oscillating between
+        two cells for the last stallWindow turns (see StallDetector).
+        """
+        return self.stallDetector.isStalled()
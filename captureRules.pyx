@@ -0,0 +1,480 @@
+# captureRules.py
+# ---------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+# 
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+"""
+The rules of capture: how an agent's action changes a capture GameState.
+These are the per-move hot paths of every game, so they live in a compiled
+module; capture.py imports AgentRules and the scoring constants from here.
+"""
+from game import Actions
+from util import nearestPoint
+from util import manhattanDistance
+from game import Configuration
+
+# If you change these, you won't affect the server, so you can't cheat
+KILL_POINTS = .05
+FOOD_POINTS = .1
+CAPSULE_POINTS = .15
+MIN_FOOD = 2
+
+DUMP_FOOD_ON_DEATH = True  # if we have the gameplay element that dumps dots on death
+
+SCARED_TIME = 40
+
+COLLISION_TOLERANCE = 0.7  # How close ghosts must be to Pacman to kill
+
+
+class SuccessorPreview:
+    """
+    What an action does to the agent taking it, worked out by
+    AgentRules.previewAction without making the successor state:
+
+      position, direction        where the agent ends up (its start, if it died)
+      isPacman, numCarrying, scaredTimer
+                                 its state afterwards
+      died                       whether it was sent back to its start
+      killed                     the other agents it sent back to theirs
+      foodEaten, capsuleEaten    the position eaten, or None
+      foodAdded                  the food dropped by the Pacmen that died
+      scoreChange                how much the score changes
+    """
+    __slots__ = ('position', 'direction', 'isPacman', 'numCarrying', 'scaredTimer',
+                 'died', 'killed', 'foodEaten', 'capsuleEaten', 'foodAdded', 'scoreChange')
+
+
+
+class AgentRules:
+    """
+    These functions govern how each agent interacts with her environment.
+    """
+
+    def getLegalActions(state, agentIndex):
+        """
+        Returns a list of legal actions (which are both possible & allowed)
+        """
+        agentState = state.getAgentState(agentIndex)
+        conf = agentState.configuration
+        possibleActions = state.data.layout.topology.getPossibleActions(conf)
+        return AgentRules.filterForAllowedActions(agentState, possibleActions)
+    getLegalActions = staticmethod(getLegalActions)
+
+    def filterForAllowedActions(agentState, possibleActions):
+        return possibleActions
+    filterForAllowedActions = staticmethod(filterForAllowedActions)
+
+    def applyAction(state, action, agentIndex):
+        """
+        Edits the state to reflect the results of the action.
+        """
+        cdef bint isRed
+        cdef int redCount, blueCount, i
+        cdef double foodToWin
+        legal = AgentRules.getLegalActions(state, agentIndex)
+        if action not in legal:
+            raise Exception("Illegal action " + str(action))
+
+        # Update Configuration
+        agentState = state.data.agentStates[agentIndex]
+        speed = 1.0
+        # if agentState.isPacman: speed = 0.5
+        vector = Actions.directionToVector(action, speed)
+        oldConfig = agentState.configuration
+        agentState.configuration = oldConfig.generateSuccessor(vector)
+
+        # Eat
+        next = agentState.configuration.getPosition()
+        nearest = nearestPoint(next)
+
+        if next == nearest:
+            isRed = state.teams[agentIndex]
+            # Change agent type
+            agentState.isPacman = [isRed, state.isRed(
+                agentState.configuration)].count(True) == 1
+            # if he's no longer pacman, he's on his own side, so reset the num carrying timer
+            #agentState.numCarrying *= int(agentState.isPacman)
+            if agentState.numCarrying > 0 and not agentState.isPacman:
+                score = agentState.numCarrying if isRed else -1*agentState.numCarrying
+                state.data.scoreChange += score
+
+                agentState.numReturned += agentState.numCarrying
+                agentState.numCarrying = 0
+
+                agentStates = state.data.agentStates
+                redCount = 0
+                for i in state.redTeam:
+                    redCount += agentStates[i].numReturned
+                blueCount = 0
+                for i in state.blueTeam:
+                    blueCount += agentStates[i].numReturned
+                foodToWin = (state.data.layout.totalFood/2) - MIN_FOOD
+                if redCount >= foodToWin or blueCount >= foodToWin:
+                    state.data._win = True
+
+        if agentState.isPacman and manhattanDistance(nearest, next) <= 0.9:
+            AgentRules.consume(nearest, state, state.teams[agentIndex])
+
+    applyAction = staticmethod(applyAction)
+
+    def consume(position, state, bint isRed):
+        cdef int x, y, i, agentIndex
+        cdef double score
+        x, y = position
+        # Eat food
+        if state.data.food[x][y]:
+
+            # blue case is the default
+            teamIndices = state.blueTeam
+            score = -1
+            if isRed:
+                # switch if its red
+                score = 1
+                teamIndices = state.redTeam
+
+            # go increase the variable for the pacman who ate this
+            agents = [state.data.agentStates[agentIndex]
+                      for agentIndex in teamIndices]
+            i = 0
+            for agent in agents:
+                if agent.getPosition() == position:
+                    agent.numCarrying += 1
+                    agentIndex = teamIndices[i]
+                    score = FOOD_POINTS
+                    if not state.teams[agentIndex]:
+                        score = -score
+                    state.data.scoreChange += score
+                    break  # the above should only be true for one agent...
+                i += 1
+
+            # do all the score and food grid maintainenace
+            #state.data.scoreChange += score
+            state._eatFood(position)
+            state.data._foodEaten = position
+            # if (isRed and state.getBlueFood().count() == MIN_FOOD) or (not isRed and state.getRedFood().count() == MIN_FOOD):
+            #  state.data._win = True
+
+        # Eat capsule
+        if isRed:
+            myCapsules = state.getBlueCapsules()
+        else:
+            myCapsules = state.getRedCapsules()
+        if(position in myCapsules):
+            # Capsule lists are shared between states, so never edit one
+            state.data.capsules = [c for c in state.data.capsules if c != position]
+            state.data._capsuleEaten = position
+
+            # Reset all ghosts' scared timers
+            if isRed:
+                otherTeam = state.blueTeam
+            else:
+                otherTeam = state.redTeam
+            for index in otherTeam:
+                state.data.agentStates[index].scaredTimer = SCARED_TIME
+
+            # blue case is the default
+            teamIndices = state.blueTeam
+            if isRed:
+                # switch if its red
+                teamIndices = state.redTeam
+
+            agents = [state.data.agentStates[agentIndex]
+                      for agentIndex in teamIndices]
+            i = 0
+            for agent in agents:
+                if agent.getPosition() == position:
+                    agentIndex = teamIndices[i]
+                    score = CAPSULE_POINTS
+                    if not state.teams[agentIndex]:
+                        score = -score
+                    state.data.scoreChange += score
+                    break  # the above should only be true for one agent...
+                i += 1
+
+    consume = staticmethod(consume)
+
+    def decrementTimer(state):
+        cdef int timer = state.scaredTimer
+        if timer == 1:
+            # Configurations are shared between states, so replace rather than edit
+            config = state.configuration
+            state.configuration = Configuration(nearestPoint(config.pos), config.direction)
+        state.scaredTimer = max(0, timer - 1)
+    decrementTimer = staticmethod(decrementTimer)
+
+    def dumpFoodFromDeath(state, agentState, agentIndex):
+        cdef int x, y, numToDump
+        cdef bint isRed
+        if not (DUMP_FOOD_ON_DEATH):
+            # this feature is not turned on
+            return
+
+        if not agentState.isPacman:
+            raise Exception(
+                'something is seriously wrong, this agent isnt a pacman!')
+
+        # ok so agentState is this:
+        if (agentState.numCarrying == 0):
+            return
+
+        # first, score changes!
+        # we HACK pack that ugly bug by just determining if its red based on the first position
+        # to die...
+        isRed = state.isRed(agentState.getPosition())
+
+        # the score increases if red eats dots, so if we are refunding points,
+        # the direction should be -1 if the red agent died, which means he dies
+        # on the blue side
+        scoreDirection = (-1)**(int(isRed) + 1)
+        #state.data.scoreChange += scoreDirection * agentState.numCarrying
+
+        # we have food to dump
+        food = state.data.food
+        occupied = set(state.getAgentPosition(i)
+                       for i in range(state.getNumAgents()))
+        foodAdded = AgentRules.dumpCells(state, agentState.getPosition(), agentState.numCarrying,
+                                         food, state.data.capsules, occupied)
+
+        food = food.copyColumns([x for x, y in foodAdded])
+        for x, y in foodAdded:
+            food[x][y] = True
+        state.data.food = food
+        state._addTeamFood(foodAdded)
+        state.data._foodAdded = foodAdded
+        # now our agentState is no longer carrying food
+        agentState.numCarrying = 0
+        pass
+
+    dumpFoodFromDeath = staticmethod(dumpFoodFromDeath)
+
+    def dumpCells(state, position, int numToDump, food, capsules, occupied, eaten=None):
+        """
+        The cells the food of a Pacman dying at position is dropped on.
+        """
+        cdef int x, y
+        # -- walk the cells around the agent in BFS order (see
+        #    layout.Topology.getDumpOrder), which already only holds cells
+        #    that are within the limits, not walls and on the right side of
+        #    the grid.  Check:
+        #   - that there's no food there yet (eaten no longer counts)
+        #   - that no other agents are there
+        #   - that no power pellets are there
+        foodAdded = []
+        for x, y in state.data.layout.topology.getDumpOrder(position):
+            if (food[x][y] and (x, y) != eaten) or (x, y) in capsules or (x, y) in occupied:
+                continue
+            foodAdded.append((x, y))
+            numToDump -= 1
+            if numToDump == 0:
+                break
+        if numToDump > 0:
+            raise Exception('Exhausted BFS! uh oh')
+        return foodAdded
+    dumpCells = staticmethod(dumpCells)
+
+    def checkDeath(state, int agentIndex):
+        cdef int index
+        cdef double score
+        agentState = state.data.agentStates[agentIndex]
+        if state.teams[agentIndex]:
+            otherTeam = state.blueTeam
+        else:
+            otherTeam = state.redTeam
+        if agentState.isPacman:
+            for index in otherTeam:
+                otherAgentState = state.data.agentStates[index]
+                if otherAgentState.isPacman:
+                    continue
+                ghostPosition = otherAgentState.getPosition()
+                if ghostPosition == None:
+                    continue
+                if manhattanDistance(ghostPosition, agentState.getPosition()) <= COLLISION_TOLERANCE:
+                    # award points to the other team for killing Pacmen
+                    if otherAgentState.scaredTimer <= 0:
+                        AgentRules.dumpFoodFromDeath(
+                            state, agentState, agentIndex)
+
+                        score = KILL_POINTS
+                        if state.teams[agentIndex]:
+                            score = -score
+                        state.data.scoreChange += score
+                        agentState.isPacman = False
+                        agentState.configuration = agentState.start
+                        agentState.scaredTimer = 0
+                    else:
+                        score = KILL_POINTS
+                        if state.teams[agentIndex]:
+                            score = -score
+                        state.data.scoreChange += score
+                        otherAgentState.isPacman = False
+                        otherAgentState.configuration = otherAgentState.start
+                        otherAgentState.scaredTimer = 0
+        else:  # Agent is a ghost
+            for index in otherTeam:
+                otherAgentState = state.data.agentStates[index]
+                if not otherAgentState.isPacman:
+                    continue
+                pacPos = otherAgentState.getPosition()
+                if pacPos == None:
+                    continue
+                if manhattanDistance(pacPos, agentState.getPosition()) <= COLLISION_TOLERANCE:
+                    # award points to the other team for killing Pacmen
+                    if agentState.scaredTimer <= 0:
+                        AgentRules.dumpFoodFromDeath(
+                            state, otherAgentState, agentIndex)
+
+                        score = KILL_POINTS
+                        if not state.teams[agentIndex]:
+                            score = -score
+                        state.data.scoreChange += score
+                        otherAgentState.isPacman = False
+                        otherAgentState.configuration = otherAgentState.start
+                        otherAgentState.scaredTimer = 0
+                    else:
+                        score = KILL_POINTS
+                        if state.teams[agentIndex]:
+                            score = -score
+                        state.data.scoreChange += score
+                        agentState.isPacman = False
+                        agentState.configuration = agentState.start
+                        agentState.scaredTimer = 0
+    checkDeath = staticmethod(checkDeath)
+
+    def previewAction(state, action, int agentIndex):
+        """
+        Returns a SuccessorPreview of what applyAction, checkDeath and
+        decrementTimer would do to the agent taking action, leaving state as
+        it is.  It follows those rules step by step, so change them together;
+        test_captureRules checks that the two agree.
+        """
+        cdef bint isRed, isPacman, scareOthers = False
+        cdef int numCarrying, scaredTimer, index
+        cdef double scoreChange = 0
+        legal = AgentRules.getLegalActions(state, agentIndex)
+        if action not in legal:
+            raise Exception("Illegal action " + str(action))
+
+        agentStates = state.data.agentStates
+        agentState = agentStates[agentIndex]
+        isRed = state.teams[agentIndex]
+        isPacman = agentState.isPacman
+        numCarrying = agentState.numCarrying
+        scaredTimer = agentState.scaredTimer
+        config = agentState.configuration.generateSuccessor(Actions.directionToVector(action, 1.0))
+        preview = SuccessorPreview()
+        preview.died = False
+        preview.killed = []
+        preview.foodEaten = None
+        preview.capsuleEaten = None
+        preview.foodAdded = []
+
+        # applyAction
+        next = config.getPosition()
+        nearest = nearestPoint(next)
+        if next == nearest:
+            isPacman = isRed != state.isRed(config)
+            if numCarrying > 0 and not isPacman:
+                scoreChange += numCarrying if isRed else -numCarrying
+                numCarrying = 0
+        # Other agents' positions, as checkDeath and dumpFoodFromDeath see them
+        positions = dict((index, agentStates[index].getPosition()) for index in range(len(agentStates)))
+        positions[agentIndex] = next
+        teamIndices = state.redTeam if isRed else state.blueTeam
+        if isPacman and manhattanDistance(nearest, next) <= 0.9:
+            x, y = nearest
+            if state.data.food[x][y]:
+                for index in teamIndices:
+                    if positions[index] == nearest:
+                        if index == agentIndex:
+                            numCarrying += 1
+                        scoreChange += FOOD_POINTS if state.teams[index] else -FOOD_POINTS
+                        break
+                preview.foodEaten = nearest
+            if nearest in (state.getBlueCapsules() if isRed else state.getRedCapsules()):
+                preview.capsuleEaten = nearest
+                scareOthers = True
+                for index in teamIndices:
+                    if positions[index] == nearest:
+                        scoreChange += CAPSULE_POINTS if state.teams[index] else -CAPSULE_POINTS
+                        break
+
+        # checkDeath
+        capsules = state.data.capsules
+        if preview.capsuleEaten is not None:
+            capsules = [c for c in capsules if c != preview.capsuleEaten]
+        killScore = -KILL_POINTS if isRed else KILL_POINTS
+        if isPacman:
+            for index in (state.blueTeam if isRed else state.redTeam):
+                otherAgentState = agentStates[index]
+                if otherAgentState.isPacman or index in preview.killed:
+                    continue
+                ghostPosition = positions[index]
+                if ghostPosition == None:
+                    continue
+                if manhattanDistance(ghostPosition, positions[agentIndex]) <= COLLISION_TOLERANCE:
+                    if otherAgentState.scaredTimer <= 0 and not scareOthers:
+                        if DUMP_FOOD_ON_DEATH and numCarrying > 0:
+                            preview.foodAdded += AgentRules.dumpCells(
+                                state, positions[agentIndex], numCarrying, state.data.food,
+                                capsules, set(positions.values()), preview.foodEaten)
+                            numCarrying = 0
+                        scoreChange += killScore
+                        isPacman = False
+                        preview.died = True
+                        config = agentState.start
+                        positions[agentIndex] = config.getPosition()
+                        scaredTimer = 0
+                    else:
+                        scoreChange += killScore
+                        preview.killed.append(index)
+                        positions[index] = otherAgentState.start.getPosition()
+        else:
+            for index in (state.blueTeam if isRed else state.redTeam):
+                otherAgentState = agentStates[index]
+                if not otherAgentState.isPacman or index in preview.killed:
+                    continue
+                pacPos = positions[index]
+                if pacPos == None:
+                    continue
+                if manhattanDistance(pacPos, positions[agentIndex]) <= COLLISION_TOLERANCE:
+                    if scaredTimer <= 0:
+                        if DUMP_FOOD_ON_DEATH and otherAgentState.numCarrying > 0:
+                            # Earlier drops in this move are food now
+                            dropped = set(preview.foodAdded)
+                            preview.foodAdded += AgentRules.dumpCells(
+                                state, pacPos, otherAgentState.numCarrying, state.data.food,
+                                capsules, set(positions.values()) | dropped, preview.foodEaten)
+                        scoreChange += -killScore
+                        preview.killed.append(index)
+                        positions[index] = otherAgentState.start.getPosition()
+                    else:
+                        scoreChange += killScore
+                        isPacman = False
+                        preview.died = True
+                        config = agentState.start
+                        positions[agentIndex] = config.getPosition()
+                        scaredTimer = 0
+
+        # decrementTimer
+        if scaredTimer == 1:
+            config = Configuration(nearestPoint(config.pos), config.direction)
+        preview.position = config.getPosition()
+        preview.direction = config.direction
+        preview.isPacman = isPacman
+        preview.numCarrying = numCarrying
+        preview.scaredTimer = max(0, scaredTimer - 1)
+        preview.scoreChange = scoreChange
+        return preview
+    previewAction = staticmethod(previewAction)
+
+    def placeGhost(state, ghostState):
+        ghostState.configuration = ghostState.start
+    placeGhost = staticmethod(placeGhost)
@@ -16,12 +16,35 @@
 This file contains a Distancer object which computes and
 caches the shortest path between any two points in the maze.
 
+The distances are kept in a dense int16 matrix indexed by the cell ids of
+the layout's Topology, computed once per maze and shared by every Distancer
+on it.  When CACHE_DIRECTORY is set, matrices are also saved there (one .npy
+file per maze, named by a hash of its walls), so other processes memory-map
+them instead of computing them again.  The cache is off unless the
+PACMAN_DISTANCE_CACHE environment variable (or capture.py's --distanceCache)
+names a directory; nothing in it is ever removed.
+
+A process that starts workers can publish the matrices of its layouts in
+shared memory, so the workers all read one copy:
+
+  published = publishDistances(layouts)
+  pool = multiprocessing.Pool(n, attachDistances, (published,))
+
 Example:
 distancer = Distancer(gameState.data.layout)
 distancer.getDistance( (1,1), (10,10) )
 """
 
 import sys, time, random
+import atexit
+import hashlib
+import os
+import tempfile
+from multiprocessing import shared_memory
+import numpy
+
+# Stored for cells that can't reach each other
+UNREACHABLE = -1
 
 class Distancer:
   def __init__(self, layout, default = 10000):
@@ -29,6 +52,7 @@ class Distancer:
     Initialize with Distancer(layout).  Changing default is unnecessary.
     """
     self._distances = None
+    self._cellIds = layout.topology.cellIds
     self.default = default
     self.dc = DistanceCalculator(layout, self, default)
 
@@ -39,7 +63,7 @@ class Distancer:
     """
     The getDistance function is the only one you'll need after you create the object.
     """
-    if self._distances == None:
+    if self._distances is None:
       return manhattanDistance(pos1, pos2)
     if isInt(pos1) and isInt(pos2):
       return self.getDistanceOnGrid(pos1, pos2)
@@ -55,14 +79,57 @@ class Distancer:
     return bestDistance
 
   def getDistanceOnGrid(self, pos1, pos2):
-    key = (pos1, pos2)
-    if key in self._distances:
-      return self._distances[key]
-    else:
-      raise Exception("Positions not in grid: " + str(key))
+    cellIds = self._cellIds
+    if pos1 not in cellIds or pos2 not in cellIds:
+      raise Exception("Positions not in grid: " + str((pos1, pos2)))
+    distance = self._distances.item(cellIds[pos1], cellIds[pos2])
+    if distance == UNREACHABLE:
+      return sys.maxsize
+    return distance
+
+  def getDistances(self, pos, targets):
+    """
+    Returns a NumPy array of the distances from pos to each of targets: a
+    list of positions, a Grid (or anything else with asList) of booleans,
+    or a boolean NumPy array of the board's shape, whose targets are taken
+    in Grid.asList order.  The distances are those getDistance returns,
+    looked up in one go.
+    """
+    if isinstance(targets, numpy.ndarray):
+      targets = [tuple(target) for target in numpy.argwhere(targets).tolist()]
+    elif hasattr(targets, 'asList'):
+      targets = targets.asList()
+    cellIds = self._cellIds
+    ids = [cellIds.get(target) for target in targets]
+    if self._distances is None or None in ids:
+      # Targets between cells: one at a time
+      return numpy.array([self.getDistance(pos, target) for target in targets])
+    best = None
+    for snap, snapDistance in getGrids2D(pos):
+      if snap not in cellIds:
+        raise Exception("Positions not in grid: " + str((snap, targets)))
+      distances = self._distances[cellIds[snap], ids].astype(numpy.int64)
+      if (distances == UNREACHABLE).any():
+        distances[distances == UNREACHABLE] = sys.maxsize
+      if snapDistance:
+        distances = distances + snapDistance
+      best = distances if best is None else numpy.minimum(best, distances)
+    if not isInt(pos):
+      best = numpy.minimum(best, self.default)
+    return best
+
+  def nearest(self, pos, targets):
+    """
+    Returns the distance from pos to the closest of targets (see
+    getDistances), or default if there are none.
+    """
+    distances = self.getDistances(pos, targets)
+    if len(distances) == 0:
+      return self.default
+    return distances.min().item()
 
   def isReadyForMazeDistance(self):
-    return self._distances != None
+    return self._distances is not None
 
 def manhattanDistance(x, y ):
   return abs( x[0] - y[0] ) + abs( x[1] - y[1] )
@@ -90,6 +157,9 @@ def getGrids1D(x):
 
 distanceMap = {}
 
+CACHE_DIRECTORY = os.environ.get('PACMAN_DISTANCE_CACHE', '')
+CACHE_VERSION = 1
+
 class DistanceCalculator:
   def __init__(self, layout, distancer, default = 10000):
     self.layout = layout
@@ -100,58 +170,148 @@ class DistanceCalculator:
     global distanceMap
 
     if self.layout.walls not in distanceMap:
-      distances = computeDistances(self.layout)
+      distances = getDistanceMatrix(self.layout.topology)
       distanceMap[self.layout.walls] = distances
     else:
       distances = distanceMap[self.layout.walls]
 
     self.distancer._distances = distances
 
-def computeDistances(layout):
-    "Runs UCS to all other positions from each position"
-    distances = {}
-    allNodes = layout.walls.asList(False)
-    for source in allNodes:
-        dist = {}
-        closed = {}
-        for node in allNodes:
-            dist[node] = sys.maxsize
-        import util
-        queue = util.PriorityQueue()
-        queue.push(source, 0)
-        dist[source] = 0
-        while not queue.isEmpty():
-            node = queue.pop()
-            if node in closed:
-                continue
-            closed[node] = True
-            nodeDist = dist[node]
-            adjacent = []
-            x, y = node
-            if not layout.isWall((x,y+1)):
-                adjacent.append((x,y+1))
-            if not layout.isWall((x,y-1)):
-                adjacent.append((x,y-1) )
-            if not layout.isWall((x+1,y)):
-                adjacent.append((x+1,y) )
-            if not layout.isWall((x-1,y)):
-                adjacent.append((x-1,y))
-            for other in adjacent:
-                if not other in dist:
-                    continue
-                oldDist = dist[other]
-                newDist = nodeDist+1
-                if newDist < oldDist:
-                    dist[other] = newDist
-                    queue.push(other, newDist)
-        for target in allNodes:
-            distances[(target, source)] = dist[target]
+def computeDistanceMatrix(topology):
+    """
+    Runs a breadth first search from every open cell and returns the
+    distances as a matrix indexed by topology cell ids.
+    """
+    adjacent = topology.adjacent
+    numCells = len(adjacent)
+    assert numCells <= numpy.iinfo(numpy.int16).max, 'Too many cells for int16 distances'
+    distances = numpy.empty((numCells, numCells), dtype=numpy.int16)
+    for source in range(numCells):
+        row = [UNREACHABLE] * numCells
+        row[source] = 0
+        frontier = [source]
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for cell in frontier:
+                for other in adjacent[cell]:
+                    if row[other] == UNREACHABLE:
+                        row[other] = distance
+                        nextFrontier.append(other)
+            frontier = nextFrontier
+        distances[source] = row
     return distances
 
 
-def getDistanceOnGrid(distances, pos1, pos2):
-    key = (pos1, pos2)
-    if key in distances:
-      return distances[key]
-    return 100000
+def wallsHash(walls):
+    "A stable hex digest of the size and walls of a maze"
+    cells = ''.join(['1' if wall else '0' for column in walls.data for wall in column])
+    text = '%d %d %s' % (walls.width, walls.height, cells)
+    return hashlib.sha1(text.encode('ascii')).hexdigest()
+
+
+def cacheFile(topology, directory=None):
+    "The file the distance matrix of the topology's maze is cached in"
+    if directory is None:
+        directory = CACHE_DIRECTORY
+    return os.path.join(directory, 'distances-v%d-%s.npy' % (CACHE_VERSION, wallsHash(topology.walls)))
+
+
+def getDistanceMatrix(topology, directory=None):
+    """
+    Returns the distance matrix of the topology's maze, memory-mapped from
+    the cache when it is there, and computed and written to the cache when
+    it isn't.  Problems with the cache are never fatal: the matrix is then
+    just computed.
+    """
+    shared = _shared.get(wallsHash(topology.walls))
+    if shared is not None:
+        return shared[1]
+    if directory is None:
+        directory = CACHE_DIRECTORY
+    if not directory:
+        return computeDistanceMatrix(topology)
+    path = cacheFile(topology, directory)
+    numCells = len(topology.cells)
+    try:
+        distances = numpy.load(path, mmap_mode='r')
+        if distances.dtype == numpy.int16 and distances.shape == (numCells, numCells):
+            return distances
+    except (OSError, ValueError):
+        pass
+    distances = computeDistanceMatrix(topology)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file and rename it, so readers never see a
+        # partly written matrix
+        handle, temporaryPath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                numpy.save(f, distances)
+            os.replace(temporaryPath, path)
+        except BaseException:
+            os.unlink(temporaryPath)
+            raise
+    except OSError:
+        pass
+    return distances
+
+#################
+# Shared memory #
+#################
+
+# The matrices in shared memory, by walls hash: (memory, matrix, owned)
+_shared = {}
+
+
+def _sharedMatrix(memory, numCells):
+    matrix = numpy.ndarray((numCells, numCells), dtype=numpy.int16, buffer=memory.buf)
+    matrix.flags.writeable = False
+    return matrix
+
+
+def publishDistances(layouts):
+    """
+    Puts the distance matrix of each layout in shared memory, where this
+    process and the workers that attach to it will read it from.  Returns
+    what attachDistances needs to find them; it can be pickled.
+    """
+    published = {}
+    for layout in layouts:
+        topology = layout.topology
+        key = wallsHash(topology.walls)
+        if key not in _shared:
+            distances = getDistanceMatrix(topology)
+            memory = shared_memory.SharedMemory(create=True, size=max(1, distances.nbytes))
+            matrix = numpy.ndarray(distances.shape, dtype=numpy.int16, buffer=memory.buf)
+            matrix[:] = distances
+            _shared[key] = (memory, _sharedMatrix(memory, len(distances)), True)
+        memory, matrix, owned = _shared[key]
+        published[key] = (memory.name, len(matrix))
+    return published
+
+
+def attachDistances(published):
+    """
+    Makes Distancers in this process read the matrices published by
+    publishDistances (usually in the process that started this one).  Can
+    be used as a multiprocessing pool initializer.
+    """
+    for key, (name, numCells) in published.items():
+        if key not in _shared:
+            memory = shared_memory.SharedMemory(name=name)
+            _shared[key] = (memory, _sharedMatrix(memory, numCells), False)
+
+
+def releaseDistances():
+    """
+    Frees the shared memory published by this process.  Distancers still
+    using it keep working until they are gone.
+    """
+    for key, (memory, matrix, owned) in list(_shared.items()):
+        if owned:
+            memory.unlink()
+            del _shared[key]
 
+atexit.register(releaseDistances)
@@ -76,6 +76,7 @@ class Configuration:
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
     """
+    __slots__ = ('pos', 'direction')
 
     def __init__(self, pos, direction):
         self.pos = pos
@@ -122,6 +123,8 @@ class AgentState:
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer',
+                 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -204,8 +207,16 @@ class Grid:
                 base *= 2
         return hash(h)
 
+    def _sameShape(self):
+        "An unfilled grid of the same size, skipping the work of __init__"
+        g = Grid.__new__(Grid)
+        g.CELLS_PER_INT = self.CELLS_PER_INT
+        g.width = self.width
+        g.height = self.height
+        return g
+
     def copy(self):
-        g = Grid(self.width, self.height)
+        g = self._sameShape()
         g.data = [x[:] for x in self.data]
         return g
 
@@ -213,10 +224,21 @@ class Grid:
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
+        g = self._sameShape()
         g.data = self.data
         return g
 
+    def copyColumns(self, columns):
+        """
+        Returns a copy that shares its columns with this grid, except for the
+        given columns which are copied and so can be modified safely.
+        """
+        g = self._sameShape()
+        g.data = self.data[:]
+        for x in set(columns):
+            g.data[x] = self.data[x][:]
+        return g
+
     def count(self, item =True ):
         return sum([x.count(item) for x in self.data])
 
@@ -373,6 +395,10 @@ class GameStateData:
     """
 
     """
+    # A state is copied for every move, so keep them small
+    __slots__ = ('food', 'capsules', 'agentStates', 'layout', 'score', 'timeleft',
+                 'scoreChange', '_eaten', '_foodEaten', '_foodAdded',
+                 '_capsuleEaten', '_agentMoved', '_lose', '_win')
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
@@ -565,9 +591,21 @@ class Game:
         sys.stderr = OLD_STDERR
 
 
+    def _observedState(self, agent):
+        "The state to give agent.observationFunction (see run)"
+        if getattr(agent.observationFunction, 'copiesState', False):
+            return self.state
+        return self.state.deepCopy()
+
     def run( self ):
         """
         Main control loop for game play.
+
+        Each turn the agent's observationFunction, if it has one, is given a
+        deep copy of the state.  Functions marked with copiesState = True
+        (CaptureAgent.observationFunction, agentHost.AgentHost's) are given
+        the live state instead: they must return a copy of their own and
+        leave the state they were given as it is.
         """
         self.display.initialize(self.state.data)
         self.numMoves = 0
@@ -588,7 +626,7 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
                             timed_func(self.state.deepCopy())
@@ -622,10 +660,10 @@ class Game:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = timed_func(self._observedState(agent))
                         except TimeoutFunctionException:
                             skip_action = True
                         move_time += time.time() - start_time
@@ -635,7 +673,7 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = agent.observationFunction(self._observedState(agent))
                 self.unmute()
             else:
                 observation = self.state.deepCopy()
@@ -645,7 +683,7 @@ class Game:
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
                     try:
                         start_time = time.time()
                         if skip_action:
@@ -161,6 +161,7 @@ class Genes:
             self._connections = copy.deepcopy(to_copy._connections)
             self._metaparameters = to_copy._metaparameters
             self._connections_sorted = to_copy._connections_sorted
+            self._live_inputs = None
             self.fitness = copy.deepcopy(to_copy.fitness)
         else:
             self._num_sensors = num_sensors_or_copy
@@ -171,16 +172,49 @@ class Genes:
             self._connections = []
             self._metaparameters = metaparameters
             self._connections_sorted = True
+            self._live_inputs = None
             self.fitness = 0
 
+    def live_input_indices(self):
+        """ Returns the (sorted) indices of the inputs with enabled outgoing connections, the only inputs the outputs depend on """
+        cdef Connection connection
+        if self._live_inputs is None:
+            live = set()
+            num_sensors = self._num_sensors
+            for _connection in self._connections:
+                connection = <Connection>_connection
+                if connection.enabled and 0 < connection.in_node <= num_sensors:
+                    live.add(connection.in_node - 1)
+            self._live_inputs = tuple(sorted(live))
+        return self._live_inputs
+
+    def _connections_changed(self):
+        self._live_inputs = None
+
+    def new_neurons(self):
+        """ Returns neurons for activate, with every sensor 0 """
+        return [0 for _ in range(self.total_nodes() + 1)]
+
     def feed_sensor_values(self, values, neurons=None):
         """ Run the network with the given input through the given neurons (creates them if not given), returns neuron values """
         if neurons is None:
-            neurons = [0 for _ in range(self.total_nodes() + 1)]
+            neurons = self.new_neurons()
         assert len(values) == self._num_sensors, "invalid number of inputs"
+        cdef double[:] buffer
+        if isinstance(values, np.ndarray) and values.dtype == np.float64 and values.ndim == 1:
+            # Read sensor buffers (e.g. GenesAgent._makeInput) as C doubles
+            buffer = values
+            for i in range(self._num_sensors):
+                neurons[i + 1] = buffer[i]
+        else:
+            for i in range(self._num_sensors):
+                neurons[i + 1] = values[i]
+        return self.activate(neurons)
+
+    def activate(self, neurons):
+        """ Run the network through neurons whose sensor values are already set (neuron input_node_index(i) holds input i), returns neuron values.
+        Only the inputs in live_input_indices need to be set """
         neurons[0] = 1.0  # BIAS node
-        for i in range(self._num_sensors):
-            neurons[i + 1] = values[i]
 
         def feed(unsigned long long node_index):
             node = self._dynamic_nodes[node_index]
@@ -251,6 +285,7 @@ class Genes:
         innovation_number = self._metaparameters.register_connection(input_index, output_index)
         connection = Connection(input_index, output_index, random_uniform0(self._metaparameters.new_link_weight_stdev), True, innovation_number)
         incoming.append(len(self._connections))
+        self._connections_changed()
         cdef Connection last_connection
         if len(self._connections) > 0:
             last_connection = <Connection>self._connections[-1]
@@ -277,6 +312,7 @@ class Genes:
                 choices.extend(self._dynamic_nodes[i])
             connection = <Connection>self._connections[util.random.choice(choices)]
         connection.enabled = False
+        self._connections_changed()
         new_node = array.array("I")
         self._dynamic_nodes.append(new_node)
         leading_innov, trailing_innov = self._metaparameters.register_node_split(connection.in_node, connection.out_node, self.total_nodes() - 1)
@@ -310,6 +346,7 @@ class Genes:
             return
         cdef Connection connection = <Connection>util.random.choice(self._connections)
         connection.enabled = enable
+        self._connections_changed()
 
     def mutate(self):
         """ Mutate the genes in this genome, returns self """
@@ -2,7 +2,7 @@ from os import error
 import random
 from random import randint
 from captureAgents import GenesAgent, RandomAgent
-from capture import CaptureRules
+from capture import CaptureRules, EarlyTermination
 from genes import Genes
 from baselineTeam import OffensiveReflexAgent, DefensiveReflexAgent
 import math as m
@@ -10,6 +10,7 @@ import multiprocessing as mp
 import json
 import time
 import concurrent.futures
+import distanceCalculator
 
 
 class GeneticOptimizer:
@@ -207,17 +208,28 @@ class GeneticOptimizer:
 
 class FitnessCalculator:
 
-    def __init__(self, layout, gameDisplay, length, muteAgents, catchExceptions):
+    # Games where nothing has changed for this many moves, or where the
+    # GenesAgent stands still or oscillates, are ended early; the fitness is
+    # the usual one for the game played so far.  Ending decided games would
+    # cut off score that still counts towards fitness, so that rule is off.
+    stallMoves = 200
+
+    def __init__(self, layout, gameDisplay, length, muteAgents, catchExceptions, sensors='board'):
         self.layout = layout
         self.gameDisplay = gameDisplay
         self.length = length
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
-        self.rules = CaptureRules()
+        self.sensors = sensors
+        self.rules = CaptureRules(earlyTermination=EarlyTermination(
+            decided=False, stallMoves=self.stallMoves, stalledAgents=True))
         self.prevBest = None
         self.isRunParallel = True
         self.useChamp = False
-        self.pool = mp.Pool(int(mp.cpu_count() / 2))
+        # The workers all read the parent's copy of the maze distances
+        self.sharedDistances = distanceCalculator.publishDistances([layout])
+        self.pool = mp.Pool(int(mp.cpu_count() / 2), distanceCalculator.attachDistances,
+                            (self.sharedDistances,))
 
     def calculateFitness(self, population, prevBest):
         """ Calculate and cache fitness of each individual in the population.  
@@ -233,22 +245,38 @@ class FitnessCalculator:
         for species in population:
             for individual in species["individuals"]:
                 all_inds.append(individual)
-        battler = Battler(self.prevBest, self.rules, self.layout, self.gameDisplay, self.length, self.muteAgents, self.catchExceptions)
+        battler = Battler(self.prevBest, self.rules, self.layout, self.gameDisplay, self.length, self.muteAgents, self.catchExceptions, self.sensors)
         if self.isRunParallel:
-            res = self.pool.map(battler.battle, all_inds)
-            i = 0
-            while i < len(res):
-                all_inds[i].setFitness(res[i])
-                i += 1
+            res = self.pool.map(battler.play, all_inds)
         else:
-            for ind in all_inds:
-                ind.setFitness(battler.battle(ind))
+            res = [battler.play(ind) for ind in all_inds]
+        movesSaved = 0
+        decisionHits = 0
+        decisionLookups = 0
+        i = 0
+        while i < len(res):
+            all_inds[i].setFitness(res[i][0])
+            movesSaved += res[i][1]
+            decisionHits += res[i][2]
+            decisionLookups += res[i][3]
+            i += 1
+        totalMoves = self.length * len(res)
+        print("MOVES_SAVED: ", movesSaved, " OF: ", totalMoves,
+              " (%.1f%%)" % (100.0 * movesSaved / max(totalMoves, 1)))
+        print("DECISIONS_CACHED: ", decisionHits, " OF: ", decisionLookups,
+              " (%.1f%%)" % (100.0 * decisionHits / max(decisionLookups, 1)))
 
 # Needed a class without pool as member
 class Battler:
 
-    def __init__(self, prevBest, rules, layout, gameDisplay, length, muteAgents, catchExceptions):
+    # The opponents remember this many of their decisions on the layout in
+    # each worker (see baselineTeam.DecisionCache); they play just as they
+    # would without
+    decisionCacheSize = 100000
+
+    def __init__(self, prevBest, rules, layout, gameDisplay, length, muteAgents, catchExceptions, sensors='board'):
             self.prevBest = prevBest
+            self.sensors = sensors
             self.layout = layout
             self.gameDisplay = gameDisplay
             self.length = length
@@ -257,13 +285,19 @@ class Battler:
             self.rules = rules
 
     def battle(self, individual):
-        agents = [GenesAgent(0, individual), DefensiveReflexAgent(1), DefensiveReflexAgent(2), DefensiveReflexAgent(3)]
+        return self.play(individual)[0]
+
+    def play(self, individual):
+        """ Returns the fitness of individual, how many moves of its game were saved by ending it early, and how many of the opponents' decisions were found in their caches, of how many looked up. """
+        agents = [GenesAgent(0, individual, sensors=self.sensors)] + \
+                 [DefensiveReflexAgent(index, decisionCacheSize=self.decisionCacheSize) for index in (1, 2, 3)]
         g = self.rules.newGame(self.layout, agents, self.gameDisplay,
                                self.length, self.muteAgents, self.catchExceptions)
         g.run()
         score = g.state.getScore()
         score = score + 40 + min(agents[0].maxPathDist, 40) / 40
-        return score
+        return (score, g.movesSaved, sum(agent.decisionHits for agent in agents[1:]),
+                sum(agent.decisionLookups for agent in agents[1:]))
 
 
 class Tournament:
@@ -282,22 +316,23 @@ class Tournament:
 
 class Runner:
 
-    def defaultGeneration(populationSize):
-        mapNodes = 16 * 32
-        totalNodes = mapNodes + 8 + 2
-        baseUnit = Genes(16 * 32 + 8 + 2, 5, Genes.Metaparameters(new_node_chance=0.3))
+    def defaultGeneration(populationSize, sensors='board'):
+        """ A first generation for GenesAgents with the given sensor profile: the board cells start unconnected, every other input is connected to every output """
+        totalNodes = GenesAgent.numInputs(sensors)
+        mapNodes = 16 * 32 if sensors == 'board' else 0
+        baseUnit = Genes(totalNodes, 5, Genes.Metaparameters(new_node_chance=0.3))
         for in_index in range(mapNodes, totalNodes):
             for out_index in range(5):
                 baseUnit.add_connection(baseUnit.input_node_index(in_index), baseUnit.output_node_index(out_index))
         return [baseUnit.clone().perturb() for _ in range(populationSize)]
 
-    def __init__(self, layout, gameDisplay, length, muteAgents, catchExceptions):
+    def __init__(self, layout, gameDisplay, length, muteAgents, catchExceptions, sensors='board'):
         maxGen = 1000
         populationSize = 150
         self.load = True
         self.save = True
         self.fitnessCalculator = FitnessCalculator(
-            layout, gameDisplay, length, muteAgents, True)
+            layout, gameDisplay, length, muteAgents, True, sensors)
         base = []
         try:
             if self.load:
@@ -305,13 +340,15 @@ class Runner:
                 f = open("sample_population.json", "r")
                 asJson = json.load(f)
                 for ind in asJson:
+                    if ind["inputCount"] != GenesAgent.numInputs(sensors):
+                        raise Exception("Saved population has other sensors")
                     if len(base) < populationSize:
                         base.append(Genes.load_from_json(ind, metaparams))
             else:
-                base = Runner.defaultGeneration(populationSize)
+                base = Runner.defaultGeneration(populationSize, sensors)
         except:
             print("Failed to load, defaulting to regeneration!")
-            base = Runner.defaultGeneration(populationSize)
+            base = Runner.defaultGeneration(populationSize, sensors)
         self.optimizer = GeneticOptimizer(base, self.fitnessCalculator, maxGen)
 
     def run(self):
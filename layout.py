@@ -14,11 +14,14 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import Actions
 import os
 import random
+from collections import deque
 from functools import reduce
 
 VISIBILITY_MATRIX_CACHE = {}
+TOPOLOGY_CACHE = {}
 
 class Layout:
     """
@@ -36,6 +39,7 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.topology = getTopology(self)
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -129,6 +133,134 @@ class Layout:
         elif layoutChar in  ['1', '2', '3', '4']:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
+
+class Topology:
+    """
+    Static movement tables for a layout's walls, built once per distinct
+    layout and shared by every copy of it.
+
+    Open cells are numbered in Grid.asList order.  For every cell the topology
+    holds its legal actions and legal neighbors (in the same order as
+    Actions.getPossibleActions and Actions.getLegalNeighbors) and whether it
+    lies on the red half of the board.
+    """
+
+    def __init__(self, walls):
+        self.walls = walls
+        self.width = walls.width
+        self.height = walls.height
+        self.cells = walls.asList(False)
+        self.cellIds = dict((pos, i) for i, pos in enumerate(self.cells))
+        self.actions = []
+        self.neighbors = []
+        self.adjacent = []
+        self.redSide = []
+        for x, y in self.cells:
+            actions = []
+            neighbors = []
+            for direction, (dx, dy) in Actions._directionsAsList:
+                nextX, nextY = x + dx, y + dy
+                if nextX < 0 or nextX == self.width or nextY < 0 or nextY == self.height:
+                    continue
+                if not walls[nextX][nextY]:
+                    actions.append(direction)
+                    neighbors.append((nextX, nextY))
+            self.actions.append(tuple(actions))
+            self.neighbors.append(tuple(neighbors))
+            self.adjacent.append(tuple(self.cellIds[n] for n in neighbors if n != (x, y)))
+            self.redSide.append(x < self.width / 2)
+        self._actionsAt = dict(zip(self.cells, self.actions))
+        self._neighborsAt = dict(zip(self.cells, self.neighbors))
+        self._dumpOrders = {}
+
+    def getCellId(self, pos):
+        """
+        Returns the id of the open cell at pos, or None for walls and
+        positions between cells.
+        """
+        return self.cellIds.get(pos)
+
+    def getPossibleActions(self, config):
+        """
+        Same as Actions.getPossibleActions(config, walls), looked up in the
+        table for agents standing on a cell.
+        """
+        actions = self._actionsAt.get(config.pos)
+        if actions is None:
+            return Actions.getPossibleActions(config, self.walls)
+        return list(actions)
+
+    def getLegalNeighbors(self, position):
+        """
+        Same as Actions.getLegalNeighbors(position, walls).
+        """
+        neighbors = self._neighborsAt.get(position)
+        if neighbors is None:
+            return Actions.getLegalNeighbors(position, self.walls)
+        return list(neighbors)
+
+    def getDumpOrder(self, position):
+        """
+        Returns the cells food can be dropped on when a Pacman dies at
+        position, in the order AgentRules.dumpFoodFromDeath tries them.
+
+        This is the order of a breadth first search over the eight cells
+        around each cell, starting from position, keeping the open cells
+        inside the border that are on the same half of the board as position.
+        Orders are computed the first time a position needs one.
+        """
+        start = (int(position[0]), int(position[1]))
+        order = self._dumpOrders.get(start)
+        if order is None:
+            order = self._computeDumpOrder(start)
+            self._dumpOrders[start] = order
+        return order
+
+    def _computeDumpOrder(self, start):
+        x0, y0 = start
+        red = x0 < self.width / 2
+        # Every cell of the board is within this many steps of the start,
+        # and cells further away can't change the order of those that are.
+        radius = max(x0, self.width - 1 - x0, y0, self.height - 1 - y0)
+        order = []
+        seen = set([start])
+        queue = deque([start])
+        while queue:
+            x, y = queue.popleft()
+            if 0 < x < self.width and 0 < y < self.height and \
+                    not self.walls[x][y] and (x < self.width / 2) == red:
+                order.append((x, y))
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    nextPos = (x + dx, y + dy)
+                    if abs(nextPos[0] - x0) > radius or abs(nextPos[1] - y0) > radius:
+                        continue
+                    if nextPos not in seen:
+                        seen.add(nextPos)
+                        queue.append(nextPos)
+        return tuple(order)
+
+    def isRedSide(self, pos):
+        """
+        Returns true if pos is on the red (left) half of the board.
+        """
+        cell = self.cellIds.get(pos)
+        if cell is None:
+            return pos[0] < self.width / 2
+        return self.redSide[cell]
+
+def getTopology(layout):
+    """
+    Returns the shared Topology for the layout's walls, building it the first
+    time a layout with these walls is loaded.
+    """
+    key = tuple(layout.layoutText)
+    topology = TOPOLOGY_CACHE.get(key)
+    if topology is None:
+        topology = Topology(layout.walls)
+        TOPOLOGY_CACHE[key] = topology
+    return topology
+
 def getLayout(name, back = 2):
     if name.endswith('.lay'):
         layout = tryToLoad('layouts/' + name)
@@ -523,6 +523,8 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--threadedDisplay', action='store_true', default=False,
+                      help='Draw in a thread of its own, dropping frames instead of slowing the game')
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -566,6 +568,11 @@ def readCommand( argv ):
     else:
         import graphicsDisplay
         args['display'] = graphicsDisplay.PacmanGraphics(options.zoom, frameTime = options.frameTime)
+        if options.threadedDisplay:
+            if options.pacman.startswith('Keyboard'):
+                raise Exception('Keyboard agents can\'t be used with a threaded display')
+            import threadedDisplay
+            args['display'] = threadedDisplay.ThreadedDisplay(args['display'])
     args['numGames'] = options.numGames
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
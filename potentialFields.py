@@ -0,0 +1,208 @@
+"""
+Distance-to-nearest-target maps ("potential fields") for capture layouts.
+
+A PotentialField holds, for every open cell of a layout, the maze distance
+to the nearest of a set of target cells, so asking how far the nearest food
+is from a cell is a single list lookup.  Fields are built with one breadth
+first search from all the targets at once, and repaired, not rebuilt, when
+targets come and go: adding a target lowers the cells around it, and
+removing one re-searches only the cells whose nearest target it was.
+
+LayoutFields keeps the fields a capture game needs: the food and capsules on
+each side of the board and each team's home border.  getFields(gameState)
+returns the fields of the state's layout, brought up to date with it:
+
+  fields = potentialFields.getFields(gameState)
+  fields.blueFood.getDistance(myPos)   # how far red has to go to eat
+  fields.redBorder.getDistance(myPos)  # how far red has to go to get home
+"""
+
+from distanceCalculator import getGrids2D
+
+
+class PotentialField:
+    """
+    The maze distance from every open cell to the nearest target cell.
+    values[cellId] holds the distance of the cell with that topology cell
+    id, or default when there are no targets it can reach.
+    """
+
+    def __init__(self, topology, targets=(), default=10000):
+        self.topology = topology
+        self.default = default
+        self.targets = set()
+        self.values = [default] * len(topology.cells)
+        self.setTargets(targets)
+
+    def getDistance(self, pos):
+        """
+        The distance from pos to the nearest target.  Positions between
+        cells are snapped like Distancer.getDistance does.
+        """
+        cellIds = self.topology.cellIds
+        cell = cellIds.get(pos)
+        if cell is not None:
+            return self.values[cell]
+        best = self.default
+        for snap, snapDistance in getGrids2D(pos):
+            distance = self.values[cellIds[snap]] + snapDistance
+            if distance < best:
+                best = distance
+        return best
+
+    def setTargets(self, positions):
+        """
+        Makes positions the targets, repairing the field around the targets
+        that were added or removed (or rebuilding it, when most changed).
+        """
+        cellIds = self.topology.cellIds
+        targets = set(cellIds[pos] for pos in positions)
+        removed = self.targets - targets
+        added = targets - self.targets
+        if len(removed) + len(added) > len(self.values) // 8:
+            self.targets = targets
+            self.values = [self.default] * len(self.values)
+            self._lower(targets)
+            return
+        for cell in removed:
+            self._remove(cell)
+        if added:
+            self.targets |= added
+            self._lower(added)
+
+    def addTarget(self, pos):
+        cell = self.topology.cellIds[pos]
+        if cell not in self.targets:
+            self.targets.add(cell)
+            self._lower([cell])
+
+    def removeTarget(self, pos):
+        cell = self.topology.cellIds[pos]
+        if cell in self.targets:
+            self._remove(cell)
+
+    def _lower(self, sources):
+        """
+        Breadth first search from new targets, lowering the cells that are
+        now nearer a target than they were.
+        """
+        values = self.values
+        adjacent = self.topology.adjacent
+        frontier = []
+        for cell in sources:
+            if values[cell] != 0:
+                values[cell] = 0
+                frontier.append(cell)
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for cell in frontier:
+                for other in adjacent[cell]:
+                    if values[other] > distance:
+                        values[other] = distance
+                        nextFrontier.append(other)
+            frontier = nextFrontier
+
+    def _remove(self, target):
+        """
+        Removes a target and repairs the cells whose nearest target it was.
+        """
+        self.targets.discard(target)
+        values = self.values
+        adjacent = self.topology.adjacent
+        default = self.default
+        # The cells that may have had target as their nearest are exactly
+        # those reached from it by steps that each go one further away
+        affected = [target]
+        inAffected = set(affected)
+        i = 0
+        while i < len(affected):
+            cell = affected[i]
+            i += 1
+            farther = values[cell] + 1
+            for other in adjacent[cell]:
+                if values[other] == farther and other not in inAffected:
+                    inAffected.add(other)
+                    affected.append(other)
+        for cell in affected:
+            values[cell] = default
+        # Seed the affected cells from the cells around them, whose
+        # distances still hold, then search outwards in distance order
+        buckets = {}
+        for cell in affected:
+            best = default
+            for other in adjacent[cell]:
+                if other not in inAffected and values[other] + 1 < best:
+                    best = values[other] + 1
+            if best < default:
+                values[cell] = best
+                buckets.setdefault(best, []).append(cell)
+        while buckets:
+            distance = min(buckets)
+            for cell in buckets.pop(distance):
+                if values[cell] != distance:
+                    continue
+                for other in adjacent[cell]:
+                    if values[other] > distance + 1 and other in inAffected:
+                        values[other] = distance + 1
+                        buckets.setdefault(distance + 1, []).append(other)
+
+
+class LayoutFields:
+    """
+    The fields of a capture layout: redFood and blueFood (the food on each
+    half), redCapsules and blueCapsules (split as getRedCapsules and
+    getBlueCapsules do), and redBorder and blueBorder (the cells of each
+    half next to the middle, where a Pacman carrying food gets home).
+    update(gameState) brings the food and capsule fields up to date with a
+    state.
+    """
+
+    def __init__(self, topology):
+        self.topology = topology
+        redColumn = max(x for x, y in topology.cells if topology.isRedSide((x, y)))
+        self.redBorder = PotentialField(topology, [(x, y) for x, y in topology.cells if x == redColumn])
+        self.blueBorder = PotentialField(topology, [(x, y) for x, y in topology.cells if x == redColumn + 1])
+        self.redFood = PotentialField(topology)
+        self.blueFood = PotentialField(topology)
+        self.redCapsules = PotentialField(topology)
+        self.blueCapsules = PotentialField(topology)
+        self._redFood = None
+        self._blueFood = None
+        self._capsules = None
+
+    def update(self, gameState):
+        # Food and capsules are never changed once shared, so unchanged ones
+        # are the very same objects
+        redFood = gameState.getRedFood()
+        if redFood is not self._redFood:
+            self.redFood.setTargets(redFood.asList())
+            self._redFood = redFood
+        blueFood = gameState.getBlueFood()
+        if blueFood is not self._blueFood:
+            self.blueFood.setTargets(blueFood.asList())
+            self._blueFood = blueFood
+        capsules = gameState.data.capsules
+        if capsules is not self._capsules:
+            self.redCapsules.setTargets(gameState.getRedCapsules())
+            self.blueCapsules.setTargets(gameState.getBlueCapsules())
+            self._capsules = capsules
+        return self
+
+# The fields of each topology, shared by every agent in this process
+_fields = {}
+
+
+def getFields(gameState):
+    """
+    Returns the LayoutFields of the state's layout, brought up to date with
+    gameState.  The fields are shared, so look things up in them before
+    another state is passed in.
+    """
+    topology = gameState.data.layout.topology
+    fields = _fields.get(id(topology))
+    if fields is None or fields.topology is not topology:
+        fields = LayoutFields(topology)
+        _fields[id(topology)] = fields
+    return fields.update(gameState)
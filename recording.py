@@ -0,0 +1,270 @@
+"""
+Writes and reads recorded capture games.
+
+A recording is a small binary file:
+
+  header     magic, format version, layout hash, random seed, keyframe
+             interval, number of agents, game length, team names and the
+             layout text (so random layouts can be replayed)
+  records    one byte per move, (agentIndex << 3) | action, written as the
+             game is played, with a keyframe (the full game state, see
+             stateCodec) before the first move and after every
+             KEYFRAME_INTERVAL moves
+  footer     the number of moves and the offset of every keyframe, so a
+             reader can jump to any turn without reading the whole file
+
+A file that was cut short (e.g. the game crashed) has no footer; readers
+then find the keyframes by scanning the records.
+
+Example:
+  reader = ReplayReader('replay-0')
+  for agentIndex, action in reader.moves():
+      ...
+  state = reader.getState(500)   # the GameState after 500 moves
+"""
+
+import struct
+import io
+
+import stateCodec
+from stateCodec import ACTIONS, ACTION_CODES, layoutHash
+
+FORMAT_VERSION = 2
+KEYFRAME_INTERVAL = 100
+
+_MAGIC = b'PCRP'
+_FOOTER_MAGIC = b'PCRE'
+_HEADER = struct.Struct('<4sB20sQHBI')
+_KEYFRAME = 0x80
+_END = 0x81
+_KEYFRAME_HEAD = struct.Struct('<IH')
+_INDEX_ENTRY = struct.Struct('<II')
+_FOOTER = struct.Struct('<I4s')
+
+def _packString(s, lengthFormat='<H'):
+    data = s.encode('utf-8')
+    return struct.pack(lengthFormat, len(data)) + data
+
+
+def _unpackString(f, lengthFormat='<H'):
+    size = struct.calcsize(lengthFormat)
+    length, = struct.unpack(lengthFormat, f.read(size))
+    return f.read(length).decode('utf-8')
+
+##########
+# Writer #
+##########
+
+
+class ReplayWriter:
+    """
+    Streams a game to a recording as it is played.  Call begin with the
+    initial state, recordMove after every move and close at the end.
+    """
+
+    def __init__(self, path, layout, numAgents, length, seed=0,
+                 redTeamName='Red', blueTeamName='Blue',
+                 keyframeInterval=KEYFRAME_INTERVAL):
+        self.path = path
+        self.layout = layout
+        self.keyframeInterval = keyframeInterval
+        self.numMoves = 0
+        self.keyframes = []
+        self.file = open(path, 'wb')
+        self.file.write(_HEADER.pack(_MAGIC, FORMAT_VERSION, layoutHash(layout),
+                                     seed, keyframeInterval, numAgents, length))
+        self.file.write(_packString(redTeamName))
+        self.file.write(_packString(blueTeamName))
+        self.file.write(_packString('\n'.join(layout.layoutText), '<I'))
+
+    def begin(self, state):
+        self._writeKeyframe(state)
+
+    def recordMove(self, agentIndex, action, state):
+        """
+        Records that agentIndex took action, leading to state.
+        """
+        self.file.write(bytes((agentIndex << 3 | ACTION_CODES[action],)))
+        self.numMoves += 1
+        if self.numMoves % self.keyframeInterval == 0:
+            self._writeKeyframe(state)
+
+    def _writeKeyframe(self, state):
+        payload = stateCodec.encode(state)
+        self.keyframes.append((self.numMoves, self.file.tell()))
+        self.file.write(bytes((_KEYFRAME,)))
+        self.file.write(_KEYFRAME_HEAD.pack(self.numMoves, len(payload)))
+        self.file.write(payload)
+
+    def close(self, state=None):
+        """
+        Finishes the recording, adding a keyframe of the final state if one
+        is given.
+        """
+        if self.file is None:
+            return
+        if state is not None and (not self.keyframes or self.keyframes[-1][0] != self.numMoves):
+            self._writeKeyframe(state)
+        endOffset = self.file.tell()
+        self.file.write(bytes((_END,)))
+        self.file.write(struct.pack('<II', self.numMoves, len(self.keyframes)))
+        for entry in self.keyframes:
+            self.file.write(_INDEX_ENTRY.pack(*entry))
+        self.file.write(_FOOTER.pack(endOffset, _FOOTER_MAGIC))
+        self.file.close()
+        self.file = None
+
+##########
+# Reader #
+##########
+
+
+class ReplayReader:
+    """
+    Reads a recording written by ReplayWriter.  Moves are streamed from the
+    file, so even very long recordings are never loaded into memory whole.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        magic, version, self.layoutHash, self.seed, self.keyframeInterval, \
+            self.numAgents, self.length = _HEADER.unpack(self.file.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise Exception('%s is not a recorded game' % path)
+        if version != FORMAT_VERSION:
+            raise Exception('Unsupported recording version %d' % version)
+        self.redTeamName = _unpackString(self.file)
+        self.blueTeamName = _unpackString(self.file)
+        self.layoutText = _unpackString(self.file, '<I').split('\n')
+        self.recordsStart = self.file.tell()
+        self._layout = None
+        self._keyframes = None
+        self._numMoves = None
+
+    def getLayout(self):
+        if self._layout is None:
+            import layout
+            self._layout = layout.Layout(self.layoutText)
+            if layoutHash(self._layout) != self.layoutHash:
+                raise Exception('Layout of %s does not match its hash' % self.path)
+        return self._layout
+
+    def _records(self, offset):
+        """
+        Yields (kind, value, offset) for the records starting at offset, where
+        kind is 'move', 'keyframe' or 'end'.
+        """
+        f = self.file
+        buffer = b''
+        position = 0
+        while True:
+            if position >= len(buffer):
+                # Seek before every read so other reads in between are harmless
+                offset += len(buffer)
+                f.seek(offset)
+                buffer = f.read(self.CHUNK_SIZE)
+                position = 0
+                if not buffer:
+                    return
+            code = buffer[position]
+            if code < _KEYFRAME:
+                yield 'move', (code >> 3, ACTIONS[code & 7]), offset + position
+                position += 1
+                continue
+            recordOffset = offset + position
+            if code == _END:
+                yield 'end', None, recordOffset
+                return
+            f.seek(recordOffset + 1)
+            head = f.read(_KEYFRAME_HEAD.size)
+            if len(head) < _KEYFRAME_HEAD.size:
+                return
+            turn, size = _KEYFRAME_HEAD.unpack(head)
+            offset = recordOffset + 1 + _KEYFRAME_HEAD.size + size
+            if f.seek(0, io.SEEK_END) < offset:
+                # A keyframe cut short by the end of the file
+                return
+            yield 'keyframe', (turn, size), recordOffset
+            buffer = b''
+            position = 0
+
+    def moves(self):
+        """
+        Yields the (agentIndex, action) pairs of the game in order.
+        """
+        for kind, value, offset in self._records(self.recordsStart):
+            if kind == 'move':
+                yield value
+
+    def _loadIndex(self):
+        if self._keyframes is not None:
+            return
+        f = self.file
+        f.seek(0, io.SEEK_END)
+        size = f.tell()
+        if size >= self.recordsStart + _FOOTER.size:
+            f.seek(size - _FOOTER.size)
+            endOffset, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic == _FOOTER_MAGIC:
+                f.seek(endOffset + 1)
+                self._numMoves, count = struct.unpack('<II', f.read(8))
+                self._keyframes = [_INDEX_ENTRY.unpack(f.read(_INDEX_ENTRY.size))
+                                   for i in range(count)]
+                return
+        # No footer: the recording was cut short, so scan it
+        self._keyframes = []
+        self._numMoves = 0
+        for kind, value, offset in self._records(self.recordsStart):
+            if kind == 'move':
+                self._numMoves += 1
+            elif kind == 'keyframe':
+                self._keyframes.append((value[0], offset))
+
+    def getNumMoves(self):
+        self._loadIndex()
+        return self._numMoves
+
+    def getState(self, turn):
+        """
+        Returns the GameState after the first turn moves, starting from the
+        nearest keyframe at or before turn.
+        """
+        self._loadIndex()
+        if turn < 0 or turn > self._numMoves:
+            raise IndexError('turn %d is outside the recording' % turn)
+        keyTurn, keyOffset = max(k for k in self._keyframes if k[0] <= turn)
+        f = self.file
+        f.seek(keyOffset + 1)
+        keyTurn, size = _KEYFRAME_HEAD.unpack(f.read(_KEYFRAME_HEAD.size))
+        state = stateCodec.decode(f.read(size), self.getLayout())
+        current = keyTurn
+        if current == turn:
+            return state
+        for kind, value, offset in self._records(keyOffset):
+            if kind == 'move':
+                state = state.generateSuccessor(*value)
+                current += 1
+                if current == turn:
+                    break
+        return state
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def readReplays(paths):
+    """
+    Yields a ReplayReader for each path in turn, closing each before the next
+    is opened.
+    """
+    for path in paths:
+        reader = ReplayReader(path)
+        try:
+            yield reader
+        finally:
+            reader.close()
@@ -0,0 +1,67 @@
+import geneticOptimizer  # before capture: the two import each other (see unpack.py)
+from geneticOptimizer import Runner
+from baselineTeam import DefensiveReflexAgent
+from capture import CaptureRules
+from captureAgents import GenesAgent
+import layout
+import numpy as np
+import textDisplay
+import random
+import sys
+import time
+
+# Compares the 'board' and 'features' sensor profiles of GenesAgent: how
+# big their genomes are, how fast they breed and compare, and how many games
+# a second they play.  Board genomes only fit 32 x 16 layouts (the default).
+#   python sensorBenchmark.py [layout] [games]
+
+length = 1200
+populationSize = 20
+mutations = 20
+
+
+def benchmark(layoutName, numGames):
+    gameLayout = layout.getLayout(layoutName)
+    rules = CaptureRules(quiet=True)
+    print('%s, %d games of %d moves per profile' % (layoutName, numGames, length))
+    print('%10s %7s %7s %9s %12s %8s %8s' % ('sensors', 'inputs', 'links', 'breed us',
+                                            'distance us', 'games/s', 'moves/s'))
+    for sensors in GenesAgent.SENSOR_PROFILES:
+        random.seed(0)
+        np.random.seed(0)
+        population = Runner.defaultGeneration(populationSize, sensors)
+        for ind in population:
+            for _ in range(mutations):
+                ind.mutate()
+        links = sum(len(ind.as_json()["connections"]) for ind in population) / len(population)
+
+        start = time.perf_counter()
+        for a in population:
+            for b in population:
+                a.breed(b)
+        breedTime = (time.perf_counter() - start) / len(population) ** 2
+
+        start = time.perf_counter()
+        for a in population:
+            for b in population:
+                a.distance(b)
+        distanceTime = (time.perf_counter() - start) / len(population) ** 2
+
+        moves = 0
+        start = time.perf_counter()
+        for i in range(numGames):
+            agents = [GenesAgent(0, population[i % len(population)], sensors=sensors),
+                      DefensiveReflexAgent(1), DefensiveReflexAgent(2), DefensiveReflexAgent(3)]
+            g = rules.newGame(gameLayout, agents, textDisplay.NullGraphics(), length, True, False)
+            g.run()
+            moves += len(g.moveHistory)
+        gameTime = time.perf_counter() - start
+
+        print('%10s %7d %7.1f %9.1f %12.1f %8.2f %8.0f' % (
+            sensors, GenesAgent.numInputs(sensors), links, breedTime * 1e6,
+            distanceTime * 1e6, numGames / gameTime, moves / gameTime))
+
+
+if __name__ == '__main__':
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else 'defaultCapture',
+              int(sys.argv[2]) if len(sys.argv) > 2 else 10)
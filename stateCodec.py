@@ -0,0 +1,233 @@
+"""
+A compact, versioned binary encoding of capture GameStates.
+
+An encoded state holds the score, time left, whether it is won or lost, every
+agent (position, direction, Pacman or ghost, scared timer, food carried and
+returned), the capsules and the food, in a few hundred bytes.  The layout is
+not encoded; it is referred to by a hash of its text, and decode finds it in
+a registry of the layouts this process has encoded or registered (or takes
+it as an argument).  Agents whose configuration is None stay hidden.
+
+Decoding reads straight from any buffer, so a state can be decoded from a
+memoryview over shared memory or a file without copying it first:
+
+  data = stateCodec.encode(state)
+  copy = stateCodec.decode(memoryview(data))
+  assert copy == state
+
+What the last move changed (scoreChange and the flags _agentMoved,
+_foodEaten, ...) and the sonar readings of an observation are not encoded.
+"""
+
+import bisect
+import hashlib
+import struct
+
+from game import Directions, Configuration
+
+FORMAT_VERSION = 1
+
+# version, flags, layout hash, score, time left, number of agents and capsules
+_HEAD = struct.Struct('<BB20sdiBB')
+# flags, x * 2, y * 2, direction, scared timer, food carrying, food returned
+_AGENT = struct.Struct('<BhhBHHH')
+_CAPSULE = struct.Struct('<BB')
+
+_WIN = 1
+_LOSE = 2
+_HAS_CONFIGURATION = 1
+_IS_PACMAN = 2
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST,
+           Directions.WEST, Directions.STOP]
+ACTION_CODES = dict((action, code) for code, action in enumerate(ACTIONS))
+
+
+class StateCodecException(Exception):
+    """Raised for data that can't be decoded"""
+    pass
+
+###########
+# Layouts #
+###########
+
+_layouts = {}
+_layoutHashes = {}
+
+
+def layoutHash(layout):
+    "A stable 20 byte digest of the layout text"
+    entry = _layoutHashes.get(id(layout))
+    if entry is None or entry[0] is not layout:
+        digest = hashlib.sha1('\n'.join(layout.layoutText).encode('utf-8')).digest()
+        entry = (layout, digest)
+        _layoutHashes[id(layout)] = entry
+    return entry[1]
+
+
+def registerLayout(layout):
+    """
+    Makes layout available to decode and returns its hash.  Layouts are
+    registered when a state on them is encoded.
+    """
+    digest = layoutHash(layout)
+    _layouts.setdefault(digest, layout)
+    return digest
+
+
+def getLayout(digest):
+    """
+    Returns the registered layout with the given hash.
+    """
+    layout = _layouts.get(bytes(digest))
+    if layout is None:
+        raise StateCodecException('Unknown layout %s' % bytes(digest).hex())
+    return layout
+
+############
+# Encoding #
+############
+
+
+def maxSize(layout, numAgents):
+    """
+    The most bytes an encoded state of a game on layout can take.
+    """
+    return (_HEAD.size + numAgents * _AGENT.size + len(layout.capsules) * _CAPSULE.size +
+            (layout.width * layout.height + 7) // 8)
+
+
+def encode(state):
+    """
+    Encodes a GameState (or GameStateData) and returns the bytes.
+    """
+    data = getattr(state, 'data', state)
+    buffer = bytearray(maxSize(data.layout, len(data.agentStates)))
+    size = encodeInto(data, buffer)
+    return bytes(buffer[:size])
+
+
+def encodeInto(state, buffer, offset=0):
+    """
+    Encodes a GameState (or GameStateData) into a writable buffer at offset,
+    which must have maxSize bytes free, and returns the number of bytes used.
+    """
+    data = getattr(state, 'data', state)
+    layout = data.layout
+    start = offset
+    _HEAD.pack_into(buffer, offset, FORMAT_VERSION,
+                    (_WIN if data._win else 0) | (_LOSE if data._lose else 0),
+                    registerLayout(layout), data.score, data.timeleft,
+                    len(data.agentStates), len(data.capsules))
+    offset += _HEAD.size
+    for agentState in data.agentStates:
+        config = agentState.configuration
+        if config is None:
+            # Hidden agents still show whether they are a Pacman
+            _AGENT.pack_into(buffer, offset, _IS_PACMAN if agentState.isPacman else 0,
+                             0, 0, 0, agentState.scaredTimer,
+                             agentState.numCarrying, agentState.numReturned)
+        else:
+            x, y = config.pos
+            flags = _HAS_CONFIGURATION | (_IS_PACMAN if agentState.isPacman else 0)
+            _AGENT.pack_into(buffer, offset, flags, int(x * 2), int(y * 2),
+                             ACTION_CODES[config.direction], agentState.scaredTimer,
+                             agentState.numCarrying, agentState.numReturned)
+        offset += _AGENT.size
+    for x, y in data.capsules:
+        _CAPSULE.pack_into(buffer, offset, x, y)
+        offset += _CAPSULE.size
+    # Cell (x, y) is bit x * height + y, so the last cell leads
+    food = data.food
+    cells = ''.join(['1' if hasFood else '0'
+                     for column in reversed(food.data) for hasFood in reversed(column)])
+    size = (food.width * food.height + 7) // 8
+    buffer[offset:offset + size] = int(cells, 2).to_bytes(size, 'little')
+    return offset + size - start
+
+############
+# Decoding #
+############
+
+# The initial state of each layout, copied by decode
+_initialStates = {}
+
+
+def _initialState(layout, numAgents):
+    from capture import GameState
+    key = (id(layout), numAgents)
+    state = _initialStates.get(key)
+    if state is None or state.data.layout is not layout:
+        state = GameState()
+        state.initialize(layout, numAgents)
+        state.data.timeleft = 0
+        _initialStates[key] = state
+    return state
+
+
+def decode(buffer, layout=None, offset=0):
+    """
+    Decodes the GameState encoded at offset in buffer (bytes, bytearray,
+    memoryview, ...).  The layout is looked up by its hash unless given.
+    """
+    from capture import TeamFood
+    version, flags, digest, score, timeleft, numAgents, numCapsules = \
+        _HEAD.unpack_from(buffer, offset)
+    if version != FORMAT_VERSION:
+        raise StateCodecException('Unsupported state version %d' % version)
+    if layout is None:
+        layout = getLayout(digest)
+    elif layoutHash(layout) != digest:
+        raise StateCodecException('State is not from a game on this layout')
+    offset += _HEAD.size
+
+    from capture import GameState
+    state = GameState(_initialState(layout, numAgents))
+    data = state.data
+    data.score = score
+    data.timeleft = timeleft
+    data._win = bool(flags & _WIN)
+    data._lose = bool(flags & _LOSE)
+    for agentState in data.agentStates:
+        agentFlags, x2, y2, direction, scared, carrying, returned = \
+            _AGENT.unpack_from(buffer, offset)
+        offset += _AGENT.size
+        if agentFlags & _HAS_CONFIGURATION:
+            agentState.configuration = Configuration((x2 / 2.0, y2 / 2.0), ACTIONS[direction])
+        else:
+            agentState.configuration = None
+        agentState.isPacman = bool(agentFlags & _IS_PACMAN)
+        agentState.scaredTimer = scared
+        agentState.numCarrying = carrying
+        agentState.numReturned = returned
+    capsules = []
+    for i in range(numCapsules):
+        capsules.append(_CAPSULE.unpack_from(buffer, offset))
+        offset += _CAPSULE.size
+    data.capsules = capsules
+
+    width, height = layout.width, layout.height
+    size = (width * height + 7) // 8
+    bits = int.from_bytes(memoryview(buffer)[offset:offset + size], 'little')
+    cells = format(bits, '0%db' % (width * height))[::-1]
+    food = layout.food._sameShape()
+    isFood = '1'.__eq__
+    food.data = [list(map(isFood, cells[x * height:(x + 1) * height]))
+                 for x in range(width)]
+    data.food = food
+    positions = []
+    cell = cells.find('1')
+    while cell >= 0:
+        positions.append(divmod(cell, height))
+        cell = cells.find('1', cell + 1)
+    split = bisect.bisect_left(positions, (width // 2, 0))
+    state._redFood = TeamFood(width, height, True, tuple(positions[:split]))
+    state._blueFood = TeamFood(width, height, False, tuple(positions[split:]))
+    return state
+
+
+def decodeData(buffer, layout=None, offset=0):
+    """
+    Like decode, but returns the GameStateData.
+    """
+    return decode(buffer, layout, offset).data
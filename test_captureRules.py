@@ -0,0 +1,120 @@
+"""
+Checks that AgentRules.previewAction, which follows the capture rules on
+local values, agrees with generateSuccessor: in seeded games, every legal
+action of every agent is previewed at every ply and compared with the
+successor state.  A rule changed in one place and not the other fails here.
+
+Run with python -m pytest once the .pyx modules are built.
+"""
+
+import random
+
+import pytest
+
+import geneticOptimizer  # capture and geneticOptimizer import each other; see unpack.py
+import capture
+import layout
+import textDisplay
+from game import Actions
+from baselineTeam import OffensiveReflexAgent, DefensiveReflexAgent
+from captureAgents import RandomAgent
+
+
+def assertPreviewMatches(state, agentIndex, action):
+    preview = state.previewSuccessor(agentIndex, action)
+    successor = state.generateSuccessor(agentIndex, action)
+    before, after = state.data, successor.data
+    agentState = after.agentStates[agentIndex]
+
+    assert preview.position == agentState.getPosition()
+    assert preview.direction == agentState.getDirection()
+    assert preview.isPacman == agentState.isPacman
+    assert preview.numCarrying == agentState.numCarrying
+    assert preview.scaredTimer == agentState.scaredTimer
+    assert preview.scoreChange == pytest.approx(after.scoreChange)
+
+    # Only dying moves an agent anywhere but where its action takes it
+    moved = state.getAgentState(agentIndex).configuration.generateSuccessor(
+        Actions.directionToVector(action, 1.0)).getPosition()
+    if preview.died:
+        assert preview.position == agentState.start.getPosition()
+    else:
+        assert preview.position == moved
+    killed = [index for index in range(state.getNumAgents()) if index != agentIndex and
+              after.agentStates[index].getPosition() != before.agentStates[index].getPosition()]
+    assert sorted(preview.killed) == killed
+
+    assert preview.foodEaten == after._foodEaten
+    assert preview.capsuleEaten == after._capsuleEaten
+    # _foodAdded only holds the last Pacman's drop, so compare the food itself
+    food = before.food.copy()
+    if preview.foodEaten is not None:
+        x, y = preview.foodEaten
+        food[x][y] = False
+    for x, y in preview.foodAdded:
+        assert not food[x][y]
+        food[x][y] = True
+    assert food == after.food
+    return preview
+
+
+class PreviewChecker:
+    """
+    Stands in for a recording.ReplayWriter and previews every legal action
+    of every agent in each state of the game.
+    """
+
+    def __init__(self):
+        self.actions = 0
+        self.deaths = 0
+        self.kills = 0
+        self.drops = 0
+        self.capsules = 0
+
+    def begin(self, state):
+        self.check(state)
+
+    def recordMove(self, agentIndex, action, state):
+        self.check(state)
+
+    def check(self, state):
+        for agentIndex in range(state.getNumAgents()):
+            for action in state.getLegalActions(agentIndex):
+                preview = assertPreviewMatches(state, agentIndex, action)
+                self.actions += 1
+                self.deaths += preview.died
+                self.kills += len(preview.killed)
+                self.drops += bool(preview.foodAdded)
+                self.capsules += preview.capsuleEaten is not None
+
+
+def playGame(layoutName, agents, seed, length):
+    random.seed(seed)
+    checker = PreviewChecker()
+    game = capture.CaptureRules(quiet=True).newGame(
+        layout.getLayout(layoutName), agents, textDisplay.NullGraphics(), length, True, False,
+        checker)
+    game.run()
+    return checker
+
+
+@pytest.mark.parametrize('layoutName,seed', [('tinyCapture', 0), ('tinyCapture', 1),
+                                             ('defaultCapture', 2), ('jumboCapture', 3)])
+def test_previewMatchesSuccessor(layoutName, seed):
+    agents = [OffensiveReflexAgent(0), OffensiveReflexAgent(1),
+              DefensiveReflexAgent(2), DefensiveReflexAgent(3)]
+    checker = playGame(layoutName, agents, seed, 300)
+    assert checker.actions > 0
+
+
+def test_previewMatchesSuccessorInFights():
+    # Offensive agents and random walkers keep running into each other, so
+    # these games die, kill, drop food and (on defaultCapture, which has
+    # capsules) eat capsules many times over
+    total = PreviewChecker()
+    for seed in range(6):
+        agents = [OffensiveReflexAgent(0), RandomAgent(1), RandomAgent(2), OffensiveReflexAgent(3)]
+        checker = playGame('tinyCapture' if seed % 2 else 'defaultCapture', agents, seed, 400)
+        for name in ('actions', 'deaths', 'kills', 'drops', 'capsules'):
+            setattr(total, name, getattr(total, name) + getattr(checker, name))
+    assert total.deaths and total.kills and total.drops and total.capsules
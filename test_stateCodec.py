@@ -0,0 +1,108 @@
+"""
+Round trip tests for stateCodec: seeded games are played with the baseline
+agents and every state along the way must decode to an equal GameState.
+
+Run with python -m pytest once the .pyx modules are built.
+"""
+
+import random
+
+import pytest
+
+import geneticOptimizer  # capture and geneticOptimizer import each other; see unpack.py
+import capture
+import layout
+import stateCodec
+import textDisplay
+from baselineTeam import OffensiveReflexAgent, DefensiveReflexAgent
+
+
+def assertSameState(decoded, state):
+    "GameState.__eq__, plus the fields it leaves out"
+    assert decoded == state
+    data, other = decoded.data, state.data
+    assert (data.timeleft, data._win, data._lose) == (other.timeleft, other._win, other._lose)
+    for decodedAgent, agent in zip(data.agentStates, other.agentStates):
+        assert decodedAgent.isPacman == agent.isPacman
+        assert decodedAgent.numCarrying == agent.numCarrying
+        assert decodedAgent.numReturned == agent.numReturned
+    assert decoded.getRedFood() == state.getRedFood()
+    assert decoded.getBlueFood() == state.getBlueFood()
+
+
+def assertRoundTrip(state, offset=0):
+    payload = stateCodec.encode(state)
+    assertSameState(stateCodec.decode(memoryview(payload)), state)
+
+    buffer = bytearray(offset + stateCodec.maxSize(state.data.layout, state.getNumAgents()))
+    size = stateCodec.encodeInto(state, buffer, offset)
+    assert bytes(buffer[offset:offset + size]) == payload
+    assertSameState(stateCodec.decode(memoryview(buffer), state.data.layout, offset), state)
+
+
+class RoundTripChecker:
+    """
+    Stands in for a recording.ReplayWriter and checks the state after every
+    move, and an observation of it, at a different buffer offset each time.
+    """
+
+    def __init__(self):
+        self.plies = 0
+
+    def begin(self, state):
+        self.check(state)
+
+    def recordMove(self, agentIndex, action, state):
+        self.plies += 1
+        self.check(state)
+        assertRoundTrip(state.makeObservation(agentIndex), self.plies % 7)
+
+    def check(self, state):
+        assertRoundTrip(state, self.plies % 7)
+
+
+def playGame(layoutName, seed, length):
+    random.seed(seed)
+    gameLayout = layout.getLayout(layoutName)
+    agents = [OffensiveReflexAgent(0), OffensiveReflexAgent(1),
+              DefensiveReflexAgent(2), DefensiveReflexAgent(3)]
+    checker = RoundTripChecker()
+    game = capture.CaptureRules(quiet=True).newGame(
+        gameLayout, agents, textDisplay.NullGraphics(), length, True, False, checker)
+    game.run()
+    return game, checker
+
+
+@pytest.mark.parametrize('layoutName,seed', [('tinyCapture', 0), ('tinyCapture', 1),
+                                             ('defaultCapture', 2), ('jumboCapture', 3)])
+def test_everyPlyRoundTrips(layoutName, seed):
+    game, checker = playGame(layoutName, seed, 300)
+    assert checker.plies == len(game.moveHistory) > 0
+    # The last state, after the rules decided the game
+    assertRoundTrip(game.state)
+
+
+def test_lostStateRoundTrips():
+    state = capture.GameState()
+    state.initialize(layout.getLayout('tinyCapture'), 4)
+    state.data.timeleft = 10
+    state.data._lose = True
+    assertRoundTrip(state)
+
+
+def test_otherLayoutIsRejected():
+    state = capture.GameState()
+    state.initialize(layout.getLayout('tinyCapture'), 4)
+    state.data.timeleft = 10
+    with pytest.raises(stateCodec.StateCodecException):
+        stateCodec.decode(stateCodec.encode(state), layout.getLayout('defaultCapture'))
+
+
+def test_unknownVersionIsRejected():
+    state = capture.GameState()
+    state.initialize(layout.getLayout('tinyCapture'), 4)
+    state.data.timeleft = 10
+    payload = bytearray(stateCodec.encode(state))
+    payload[0] = stateCodec.FORMAT_VERSION + 1
+    with pytest.raises(stateCodec.StateCodecException):
+        stateCodec.decode(payload)
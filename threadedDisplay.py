@@ -0,0 +1,201 @@
+"""
+Draws games in a thread of their own, dropping frames it can't keep up with.
+
+Game calls display.update after every move, and the graphical displays
+animate each move (and sleep frameTime) before returning, so watching a game
+slows it down to the speed of the drawing.  A ThreadedDisplay hands every
+update to a renderer thread through a short queue instead and returns at
+once.  When the queue already holds maxFrames frames the new update is
+merged into the last of them: the frame then shows the latest state, moves
+every agent that moved in between and replays the food and capsule changes
+it skipped, so the picture never falls out of step with the game.  Other
+calls (debugDraw, ...) can't be dropped, so when too many of them wait the
+game waits for the renderer.
+
+  display = ThreadedDisplay(captureGraphicsDisplay.PacmanGraphics(...))
+
+All drawing happens on the renderer thread, so keyboard agents (which read
+the keyboard through the window) can't be used with it.
+"""
+
+from collections import deque
+import threading
+import traceback
+
+from game import GameStateData
+
+# Kinds of food events
+_FOOD_EATEN = 0
+_FOOD_ADDED = 1
+_CAPSULE_EATEN = 2
+
+
+class _Frame:
+    """
+    An update waiting to be drawn, possibly standing for several moves.
+    """
+    __slots__ = ('state', 'moved', 'events')
+
+    def __init__(self, state):
+        self.state = state
+        self.moved = [] if state._agentMoved is None else [state._agentMoved]
+        self.events = []
+        if state._foodEaten is not None:
+            self.events.append((_FOOD_EATEN, state._foodEaten))
+        if state._capsuleEaten is not None:
+            self.events.append((_CAPSULE_EATEN, state._capsuleEaten))
+        if state._foodAdded is not None:
+            self.events.extend((_FOOD_ADDED, position) for position in state._foodAdded)
+
+    def merge(self, later):
+        """
+        Makes this frame also stand for the later one.
+        """
+        self.state = later.state
+        for agentIndex in later.moved:
+            if agentIndex not in self.moved:
+                self.moved.append(agentIndex)
+        self.events.extend(later.events)
+
+
+class ThreadedDisplay:
+    """
+    Wraps a graphical display (graphicsDisplay or captureGraphicsDisplay
+    PacmanGraphics) so that it draws in a renderer thread.  At most
+    maxFrames updates and maxCalls other calls wait to be drawn;
+    framesDropped counts the updates merged into others.
+    """
+
+    def __init__(self, display, maxFrames=2, maxCalls=100):
+        self.display = display
+        self.maxFrames = maxFrames
+        self.maxCalls = maxCalls
+        self.framesDropped = 0
+        self.queue = deque()
+        # The frames in the queue, and the last of them
+        self.numFrames = 0
+        self.lastFrame = None
+        self.condition = threading.Condition()
+        self.thread = None
+        self.error = None
+
+    def _put(self, item, merge=False):
+        with self.condition:
+            if self.error is not None:
+                return
+            if merge and self.numFrames >= self.maxFrames:
+                # Even when calls were queued after it, so that an agent
+                # drawing every move can't keep frames from merging
+                self.lastFrame.merge(item)
+                self.framesDropped += 1
+                return
+            if not merge:
+                while len(self.queue) - self.numFrames >= self.maxCalls and self.error is None:
+                    self.condition.wait()
+                if self.error is not None:
+                    return
+            self.queue.append(item)
+            if merge:
+                self.numFrames += 1
+                self.lastFrame = item
+            self.condition.notify_all()
+
+    def _call(self, name, *args, **kwargs):
+        "Queues a call to the wrapped display"
+        if self.thread is None:
+            # The thread that draws must be the one that opens the window
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self._put((name, args, kwargs))
+
+    def initialize(self, state, isBlue=False):
+        self._call('initialize', state, isBlue)
+
+    def update(self, state):
+        if self.thread is not None:
+            self._put(_Frame(state), merge=True)
+
+    def finish(self):
+        """
+        Draws everything still queued, then finishes the wrapped display.
+        Waits until it has, so the end of the game is always shown.
+        """
+        done = threading.Event()
+        self._call('finish')
+        self._put(done)
+        while not done.wait(0.1):
+            if self.error is not None or not self.thread.is_alive():
+                break
+
+    def checkNullDisplay(self):
+        return False
+
+    # Agents can draw on the display (through __main__._display) too
+    def debugDraw(self, *args, **kwargs):
+        self._call('debugDraw', *args, **kwargs)
+
+    def clearDebug(self):
+        self._call('clearDebug')
+
+    def drawExpandedCells(self, cells):
+        self._call('drawExpandedCells', cells)
+
+    def clearExpandedCells(self):
+        self._call('clearExpandedCells')
+
+    def updateDistributions(self, distributions):
+        self._call('updateDistributions', distributions)
+
+    def _run(self):
+        """
+        The renderer thread: draws whatever is queued, in order.
+        """
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                item = self.queue.popleft()
+                if isinstance(item, _Frame):
+                    self.numFrames -= 1
+                    if item is self.lastFrame:
+                        self.lastFrame = None
+                self.condition.notify_all()
+            try:
+                if isinstance(item, _Frame):
+                    self._draw(item)
+                elif isinstance(item, threading.Event):
+                    item.set()
+                else:
+                    name, args, kwargs = item
+                    getattr(self.display, name)(*args, **kwargs)
+            except Exception:
+                # A broken display (e.g. a closed window) stops the drawing,
+                # never the game
+                with self.condition:
+                    self.error = traceback.format_exc()
+                    for waiting in self.queue:
+                        if isinstance(waiting, threading.Event):
+                            waiting.set()
+                    self.queue.clear()
+                    self.numFrames = 0
+                    self.lastFrame = None
+                    self.condition.notify_all()
+                return
+
+    def _draw(self, frame):
+        display = self.display
+        state = frame.state
+        for kind, position in frame.events:
+            if kind == _FOOD_EATEN:
+                display.removeFood(position, display.food)
+            elif kind == _CAPSULE_EATEN:
+                display.removeCapsule(position, display.capsules)
+            else:
+                display.addFood(position, display.food, state.layout)
+        # Move each agent to where it is now; the food is already done
+        for agentIndex in frame.moved:
+            step = GameStateData(state)
+            step._agentMoved = agentIndex
+            if hasattr(state, 'timeleft'):
+                step.timeleft = state.timeleft
+            display.update(step)
@@ -13,22 +13,36 @@
 
 
 import os, pickle, sys
+# capture and geneticOptimizer import each other; loading geneticOptimizer
+# first is the only order in which the cycle resolves
+import geneticOptimizer
+import capture
+import recording
 
 if len(sys.argv) != 3:
   print('Usage: %s stats_file team_name' % sys.argv[0])
   print('Unpacks the stats file of a server into a bunch of replay files.')
   if len(sys.argv) == 2:
-    d = pickle.load(open(sys.argv[1]))
+    d = pickle.load(open(sys.argv[1], 'rb'))
     print('Team names:', list(d.keys()))
   sys.exit(2)
 
-d = pickle.load(open(sys.argv[1]))
+d = pickle.load(open(sys.argv[1], 'rb'))
 user = sys.argv[2]
 k = 0
 print('Unpacking games for', user)
 for g, w in d[user]['gameHistory']:
     k += 1
-    t = {'layout': g.state.data.layout, 'agents': g.agents, 'actions': g.moveHistory, 'length': g.length}
+    layout = g.state.data.layout
     fname = 'replay_' + user + '_' + str(k)
     print('Game:', fname)
-    pickle.dump(t,file(fname, 'w'))
+    # Rebuild the game from its moves so keyframes can be written
+    state = capture.GameState()
+    state.initialize(layout, len(g.agents))
+    state.data.timeleft = g.length
+    writer = recording.ReplayWriter(fname, layout, len(g.agents), g.length)
+    writer.begin(state)
+    for agentIndex, action in g.moveHistory:
+      state = state.generateSuccessor(agentIndex, action)
+      writer.recordMove(agentIndex, action, state)
+    writer.close(state)
@@ -580,19 +580,120 @@ def pause():
 
 # code to handle timeouts
 #
-# FIXME
-# NOTE: TimeoutFuncton is NOT reentrant.  Later timeouts will silently
-# disable earlier timeouts.  Could be solved by maintaining a global list
-# of active time outs.  Currently, questions which have test cases calling
-# this have all student code so wrapped.
+# Timed calls share one SIGALRM handler, installed the first time a deadline
+# is set and left in place.  Deadlines are kept on a stack of absolute times
+# and the interval timer is re-armed for the earliest one whenever the stack
+# changes, so nested timeouts work and sub-second limits are honoured.  Code
+# running under a deadline can also poll checkDeadline() to stop cleanly.
 #
 import signal
 import time
+import threading
 class TimeoutFunctionException(Exception):
     """Exception to raise on a timeout"""
     pass
 
 
+# Each thread has a stack of deadlines of its own, so a deadline started in
+# one thread never times out the code running in another
+_local = threading.local()
+_alarmThread = None
+
+
+def _deadlines():
+    deadlines = getattr(_local, 'deadlines', None)
+    if deadlines is None:
+        deadlines = _local.deadlines = []
+    return deadlines
+
+
+def _useAlarm():
+    """
+    True if deadlines can interrupt running code: SIGALRM handlers can only
+    be installed from the main thread of platforms that have the signal.
+    """
+    global _alarmThread
+    if _alarmThread is not None:
+        return threading.get_ident() == _alarmThread
+    if not hasattr(signal, 'setitimer') or \
+            threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGALRM, _handleAlarm)
+    _alarmThread = threading.get_ident()
+    return True
+
+
+def _handleAlarm(signum, frame):
+    # Handlers run in the thread that installed them, so these are its deadlines
+    deadlines = _deadlines()
+    if not deadlines:
+        return
+    if time.monotonic() >= min(deadlines):
+        raise TimeoutFunctionException()
+    # Woken up early; wait for the rest
+    _armAlarm()
+
+
+def _armAlarm():
+    deadlines = _deadlines()
+    if deadlines:
+        remaining = min(deadlines) - time.monotonic()
+        # A zero interval would disarm the timer instead of firing it
+        signal.setitimer(signal.ITIMER_REAL, max(remaining, 1e-6))
+    else:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def pushDeadline(seconds):
+    """
+    Starts a deadline seconds from now.  If it can, the deadline raises
+    TimeoutFunctionException in the running code when it passes.  Every
+    pushDeadline must be matched by a popDeadline.
+    """
+    _deadlines().append(time.monotonic() + seconds)
+    if _useAlarm():
+        _armAlarm()
+
+
+def popDeadline():
+    """
+    Ends the most recent deadline started by pushDeadline.
+    """
+    deadlines = _deadlines()
+    useAlarm = _useAlarm()
+    try:
+        if useAlarm:
+            # Disarm first: the alarm can go off (and raise) right up to here,
+            # and must not go off once the deadline is gone
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    finally:
+        # Even if it just did, the deadline is removed
+        del deadlines[-1]
+    if useAlarm:
+        _armAlarm()
+
+
+def deadlineRemaining():
+    """
+    Returns the seconds left until the earliest active deadline, or None if
+    there is no deadline.
+    """
+    deadlines = _deadlines()
+    if not deadlines:
+        return None
+    return min(deadlines) - time.monotonic()
+
+
+def checkDeadline():
+    """
+    Raises TimeoutFunctionException if a deadline has passed.  Agents doing
+    long searches can call this to stop at a point of their choosing.
+    """
+    deadlines = _deadlines()
+    if deadlines and time.monotonic() >= min(deadlines):
+        raise TimeoutFunctionException()
+
+
 class TimeoutFunction:
     def __init__(self, function, timeout):
         self.timeout = timeout
@@ -602,23 +703,20 @@ class TimeoutFunction:
         raise TimeoutFunctionException()
 
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
-            old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
-            try:
-                result = self.function(*args, **keyArgs)
-            finally:
-                signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
-        else:
-            startTime = time.time()
+        # Use a deadline to cause an exception if and when this function runs
+        # too long.  Where deadlines can't interrupt the call (no SIGALRM, or
+        # not the main thread), check the time taken after the method has
+        # returned, and throw an exception then.
+        if self.timeout <= 0:
+            self.handle_timeout(None, None)
+        startTime = time.monotonic()
+        pushDeadline(self.timeout)
+        try:
             result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
-                self.handle_timeout(None, None)
+        finally:
+            popDeadline()
+        if time.monotonic() - startTime >= self.timeout:
+            self.handle_timeout(None, None)
         return result
 
 